@@ -0,0 +1,147 @@
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+
+import fetch_cache
+import master_store
+import narrative
+import positivity
+import post_stats
+import render
+
+
+def _narrate_nyt(tasks):
+    results = []
+    for state, county, county_data in tasks:
+        try:
+            msg, today_date = narrative.build_nyt_county_narrative(county_data, county, state)
+        except (IndexError, KeyError, ValueError, ZeroDivisionError):
+            logging.exception('Could not build narrative for ' + county + ' County, ' + state)
+            msg = "No usable data for " + county + " County, " + state + "\n\n"
+        results.append((state, county, msg))
+    return results
+
+
+def _render_partition(tasks, figure_dir, formats):
+    '''
+    Export the figures of a partition of counties to figure_dir/<state>/<county>/.
+    Runs in a worker process, so the plotting libraries are imported there.
+    '''
+    import figures
+
+    paths = []
+    for state, county, county_data in tasks:
+        renderer = render.Renderer('export', os.path.join(figure_dir, state, county), formats)
+        x = 'mydate' if 'mydate' in county_data.columns else 'date'
+        try:
+            figures.generate_county_cases(county_data, county + ' County, ' + state, renderer, x)
+            paths.extend(path for exported in renderer.flush().values() for path in exported)
+        except (IndexError, KeyError, ValueError):
+            logging.exception('Could not render figures for ' + county + ' County, ' + state)
+    return paths
+
+
+def partition(tasks, n):
+    '''
+    Deal tasks round-robin into n partitions, largest first, so the partitions
+    carry a similar number of rows.
+    '''
+    tasks = sorted(tasks, key=lambda task: len(task[2]), reverse=True)
+    return [tasks[i::n] for i in range(n) if tasks[i::n]]
+
+
+def county_tasks(nyt_data, states):
+    tasks = []
+    if nyt_data is not None:
+        nyt_data = nyt_data[nyt_data['state'].isin(states) & (nyt_data['state'] != 'Arkansas')]
+        for (state, county), county_data in nyt_data.groupby(['state', 'county']):
+            tasks.append((state, county, county_data))
+    return tasks
+
+
+def figure_tasks(ar_data, nyt_data, states):
+    '''
+    (state, county, rows) of every county to draw: Arkansas counties from the
+    master file, the other states from the NYT data.
+    '''
+    tasks = []
+    if 'Arkansas' in states and ar_data is not None:
+        slices = master_store.county_slices(ar_data)
+        tasks.extend(('Arkansas', str(county), ar_data.iloc[rows][['mydate', 'New_Cases_Today']])
+                     for county, rows in slices.items() if county != 'Arkansas_all_counties')
+    tasks.extend((state, county, county_data[['date', 'New_Cases_Today']]) for state, county, county_data in county_tasks(nyt_data, states))
+    return tasks
+
+
+def render_figures(tasks, figure_dir, formats=('html',), workers=None):
+    '''
+    Export the figures of every county, spread over a process pool. Building and
+    exporting a figure takes far longer than sending a county's rows to a worker.
+    '''
+    workers = workers or os.cpu_count()
+    paths = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for partition_paths in executor.map(_render_partition, partition(tasks, workers),
+                                            [figure_dir] * workers, [list(formats)] * workers):
+            paths.extend(partition_paths)
+    return paths
+
+
+def run_batch(ar_data, nyt_data, states, workers=None, figure_dir=None, formats=('html',)):
+    '''
+    Build the narrative of every county of the given states and merge them into one
+    summary ordered by state and county. Arkansas counties are rendered from one
+    metrics table and the NYT counties take microseconds each, so the narratives
+    are built in this process. With a figure_dir, the figures of every county are
+    exported in a process pool.
+    '''
+    results = []
+    if 'Arkansas' in states and ar_data is not None:
+        narratives = narrative.render_narratives(narrative.county_metrics(ar_data[ar_data['county_nam'] != 'Arkansas_all_counties']))
+        results.extend(('Arkansas', county, msg) for county, (msg, today_date) in narratives.items())
+    results.extend(_narrate_nyt(county_tasks(nyt_data, states)))
+    results.sort(key=lambda result: (result[0], result[1]))
+
+    if figure_dir:
+        paths = render_figures(figure_tasks(ar_data, nyt_data, states), figure_dir, formats, workers)
+        logging.info(str(len(paths)) + ' county figures written to ' + figure_dir)
+    return ''.join(msg for state, county, msg in results)
+
+
+def main(config_path='./config.yaml'):
+    cfg = post_stats.load_config(config_path)
+    post_stats.configure_logging(cfg, name='batch')
+
+    batch_cfg = cfg.get('batch', {})
+    states = batch_cfg.get('states', ['Arkansas'])
+    cache_dir = cfg.get('cache_dir', fetch_cache.CACHE_DIR)
+
+    ar_data = None
+    if 'Arkansas' in states:
+        ar_data = master_store.load_master(cfg['urls']['ar_covid'],
+                                           cfg.get('master_store', master_store.STORE_PATH),
+                                           cache_dir,
+                                           cfg.get('positivity_periods', positivity.PERIODS))
+    nyt_data = None
+    nyt_file = batch_cfg.get('nyt_file', 'nyt_filtered.csv')
+    if os.path.exists(nyt_file):
+        nyt_data = pd.read_csv(nyt_file, dtype={"fips": str}, parse_dates=['date'])
+
+    now = datetime.now()
+    summary_msg = u"Statistics Summary for " + ', '.join(states) + " (" + now.strftime('%A, %b %d, %Y') + ')\n\n'
+    figure_dir = batch_cfg.get('figure_dir') if batch_cfg.get('figures') else None
+    summary_msg = summary_msg + run_batch(ar_data, nyt_data, states, batch_cfg.get('workers'), figure_dir,
+                                          batch_cfg.get('formats', ['html']))
+
+    output = batch_cfg.get('output', 'batch_summary.txt')
+    with open(output, 'w') as f:
+        f.write(summary_msg)
+    logging.info('Batch summary written to ' + output)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,122 @@
+'''
+Time and peak memory of each post_stats stage on synthetic data, offline.
+
+    python benchmarks/bench_pipeline.py [--counties 75] [--days 730] [--json results.json]
+
+Run from anywhere; the repository modules are imported from its root. Figures
+are built and serialized but not exported.
+'''
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import pandas as pd
+
+import correlation
+import master_store
+import narrative
+import positivity
+import regions
+import render
+from synthetic import synthetic_boundaries, synthetic_master
+
+
+def measure(name, fn, results):
+    tracemalloc.start()
+    start = time.perf_counter()
+    value = fn()
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    results.append({'stage': name, 'seconds': elapsed, 'peak_mb': peak / 1024 / 1024})
+    print('{:<28} {:>9.3f}s {:>10.1f} MB'.format(name, elapsed, peak / 1024 / 1024))
+    return value
+
+
+def run(n_counties, n_days, report_counties):
+    import figures
+    import post_stats
+
+    results = []
+    raw = synthetic_master(n_counties, n_days)
+    csv_bytes = raw.to_csv().encode('utf-8')
+    counties = sorted(raw['county_nam'].unique())[:report_counties]
+    primary = counties[0]
+
+    data = measure('parse', lambda: master_store.normalize(
+        pd.read_csv(io.BytesIO(csv_bytes), index_col=0, dtype={"fips": str})), results)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'master.feather')
+        measure('store write', lambda: master_store.write_store(data, path), results)
+        data = measure('store read', lambda: master_store.read_store(path), results)
+
+    # frame as pandas parses it against the compact store frame
+    default_mb = pd.read_csv(io.BytesIO(csv_bytes), index_col=0).memory_usage(deep=True).sum() / 1024 / 1024
+    compact_mb = data.memory_usage(deep=True).sum() / 1024 / 1024
+    results.append({'stage': 'frame memory', 'default_mb': default_mb, 'compact_mb': compact_mb})
+    print('{:<28} {:>9.1f} MB default dtypes, {:.1f} MB compact'.format('frame memory', default_mb, compact_mb))
+
+    measure('positivity (loop)', lambda: pd.concat(
+        [positivity.calculate_positivity_rate(data, county, 14) for county in counties]), results)
+    data = measure('positivity (grouped)', lambda: positivity.calculate_positivity_rates(data, (7, 14, 28)), results)
+
+    full_data = data[data['county_nam'].isin(counties)]
+    full_data = full_data.sort_values(by=['county_nam', 'mydate'], ascending=[True, False])
+    full_data = full_data.set_index(pd.DatetimeIndex(full_data['mydate'].values))
+
+    measure('group_counties', lambda: pd.concat(
+        [post_stats.group_counties(full_data, primary, county) for county in counties if county != primary]), results)
+    measure('group_all_counties', lambda: post_stats.group_all_counties(full_data, counties), results)
+    with tempfile.TemporaryDirectory() as tmp:
+        region_defs = regions.default_regions(counties, primary)
+        path = os.path.join(tmp, 'regions.feather')
+        measure('regions (full)', lambda: regions.update_regions(data, region_defs, path), results)
+        measure('regions (unchanged)', lambda: regions.update_regions(data, region_defs, path), results)
+    table = correlation.pivot(data, '14d_pp', None)
+    measure('correlation (rolling 28d)', lambda: correlation.rolling_corr(table, 28), results)
+    measure('correlation (lags 0-14)', lambda: correlation.lagged_corr(table, 14), results)
+    measure('narratives (per county)', lambda: [narrative.build_county_narrative(county_data, str(county))
+        for county, county_data in data.groupby('county_nam', observed=True)], results)
+    measure('narratives (one table)', lambda: narrative.render_narratives(narrative.county_metrics(data)), results)
+
+    renderer = render.Renderer('export', tempfile.mkdtemp(), formats=[])
+    who_t = 0.05
+    latest_data = data[data['mydate'] == data['mydate'].max()]
+    geojson = synthetic_boundaries(latest_data['fips'])
+
+    measure('figure: bullet', lambda: figures.generate_bullet(full_data, counties, who_t, renderer), results)
+    measure('figure: line', lambda: figures.generate_line(full_data, who_t, renderer), results)
+    for label, points in (('all points', None), ('200 points', 200)):
+        fig = measure('figure: line, all (' + label + ')', lambda: figures.generate_line(data, who_t, renderer, points), results)
+        payload_kb = len(fig.to_json()) / 1024
+        results.append({'stage': 'line payload (' + label + ')', 'kb': payload_kb})
+        print('{:<28} {:>9.0f} KB'.format('line payload (' + label + ')', payload_kb))
+    measure('figure: active cases', lambda: figures.generate_active_cases_graph(full_data, counties, renderer), results)
+    measure('figure: state map', lambda: figures.generate_state_cloropleth(
+        latest_data, geojson, latest_data['Active_Cases_10k_Pop'].min(), latest_data['Active_Cases_10k_Pop'].max(), renderer), results)
+    measure('figure: serialize', lambda: renderer.flush(), results)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--counties', type=int, default=75)
+    parser.add_argument('--days', type=int, default=730)
+    parser.add_argument('--report-counties', type=int, default=6)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    print('{} counties x {} days'.format(args.counties, args.days))
+    results = run(args.counties, args.days, args.report_counties)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'counties': args.counties, 'days': args.days, 'stages': results}, f, indent=2)
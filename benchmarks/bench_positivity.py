@@ -0,0 +1,55 @@
+'''
+Compare the per-county positivity loop with the grouped computation.
+
+    python benchmarks/bench_positivity.py [counties] [days]
+'''
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import positivity
+from synthetic import synthetic_master
+
+
+def run_loop(data):
+    frames = []
+    for county in data['county_nam'].unique():
+        frames.append(positivity.calculate_positivity_rate(data, county, 14))
+    return pd.concat(frames)
+
+
+def run_grouped(data):
+    return positivity.calculate_positivity_rates(data.copy(), (7, 14, 28))
+
+
+def timed(fn, data, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+if __name__ == '__main__':
+    n_counties = int(sys.argv[1]) if len(sys.argv) > 1 else 75
+    n_days = int(sys.argv[2]) if len(sys.argv) > 2 else 365
+    data = synthetic_master(n_counties, n_days)
+    data['mydate'] = pd.to_datetime(data['mydate'])
+
+    loop_time, loop_df = timed(run_loop, data)
+    grouped_time, grouped_df = timed(run_grouped, data)
+
+    loop_df = loop_df.sort_values(by=['county_nam', 'mydate'])
+    grouped_df = grouped_df.sort_values(by=['county_nam', 'mydate'])
+    assert np.allclose(loop_df['14d_pp'].values, grouped_df['14d_pp'].values)
+
+    print('{} counties x {} days'.format(n_counties, n_days))
+    print('per-county loop (14d only):   {:.3f}s'.format(loop_time))
+    print('grouped pass (7d, 14d, 28d):  {:.3f}s'.format(grouped_time))
+    print('speedup: {:.1f}x'.format(loop_time / grouped_time))
@@ -0,0 +1,56 @@
+'''
+Synthetic data shaped like the Arkansas master file, for offline benchmarks.
+'''
+import numpy as np
+import pandas as pd
+
+# the figures only draw days after mid September 2020, so the synthetic days end well after it
+END_DATE = '2022-03-01'
+
+
+def synthetic_master(n_counties, n_days, seed=0):
+    '''
+    Raw master-file-like frame (string mydate, 3-digit fips) with cumulative
+    counts per county over the n_days up to END_DATE, rows in random order.
+    '''
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(end=END_DATE, periods=n_days)
+    county_names = ['County ' + str(i) for i in range(n_counties)]
+    n = n_counties * n_days
+
+    new_cases = rng.poisson(rng.uniform(1, 30, n_counties).repeat(n_days))
+    new_deaths = rng.binomial(new_cases, 0.01)
+    recovered = rng.binomial(new_cases, 0.9)
+    # cumulative counts per county (rows are county-major, date-minor here)
+    per_county = lambda values: values.reshape(n_counties, n_days).cumsum(axis=1).ravel()
+    positive = per_county(new_cases)
+    deaths = per_county(new_deaths)
+    active = np.maximum(positive - per_county(recovered) - deaths, 0)
+
+    data = pd.DataFrame({
+        'county_nam': np.repeat(county_names, n_days),
+        'mydate': np.tile(dates.strftime('%m/%d/%Y'), n_counties),
+        'fips': np.repeat(['{:03d}'.format(2 * i + 1) for i in range(n_counties)], n_days),
+        'positive': positive,
+        'total_tests': rng.integers(100, 1000, n) + new_cases,
+        'active_cases': active,
+        'deaths': deaths,
+        'New_Cases_Today': new_cases,
+        'New_Deaths_Today': new_deaths,
+        'Recovered_Since_Yesterday': recovered,
+        'Active_Cases_10k_Pop': active / rng.uniform(1, 20, n_counties).repeat(n_days),
+    })
+    return data.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+def synthetic_boundaries(fips):
+    '''
+    One square polygon per FIPS code, enough for choropleth benchmarks.
+    '''
+    features = []
+    for i, f in enumerate(fips):
+        x, y = -94.5 + (i % 10) * 0.4, 33.0 + (i // 10) * 0.4
+        ring = [[x, y], [x + 0.4, y], [x + 0.4, y + 0.4], [x, y + 0.4], [x, y]]
+        features.append({'type': 'Feature', 'id': f, 'properties': {},
+                         'geometry': {'type': 'Polygon', 'coordinates': [ring]}})
+    return {'type': 'FeatureCollection', 'features': features}
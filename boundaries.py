@@ -0,0 +1,91 @@
+import hashlib
+import json
+import logging
+import os
+
+import fetch_cache
+import storage
+
+STATE_FIPS = ('05',)
+
+_loaded = {}
+
+
+def _quantize_ring(ring, precision):
+    points = []
+    for x, y in ring:
+        point = [round(x, precision), round(y, precision)]
+        if not points or point != points[-1]:
+            points.append(point)
+    # a ring collapsed below a triangle keeps its original points
+    if len(points) < 4:
+        return ring
+    return points
+
+
+def quantize(geometry, precision):
+    '''
+    Snap coordinates to a grid of the given number of decimals and drop repeated
+    points. Shared county borders snap to the same points on both sides, so the
+    simplification keeps the topology (no gaps or overlaps between counties).
+    '''
+    if geometry['type'] == 'Polygon':
+        coordinates = [_quantize_ring(ring, precision) for ring in geometry['coordinates']]
+    elif geometry['type'] == 'MultiPolygon':
+        coordinates = [[_quantize_ring(ring, precision) for ring in polygon]
+                       for polygon in geometry['coordinates']]
+    else:
+        return geometry
+    return {'type': geometry['type'], 'coordinates': coordinates}
+
+
+def subset(geojson, state_fips=STATE_FIPS, precision=None):
+    features = []
+    for feature in geojson['features']:
+        if str(feature.get('id', ''))[:2] not in state_fips:
+            continue
+        if precision is not None:
+            feature = dict(feature, geometry=quantize(feature['geometry'], precision))
+        features.append(feature)
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def index_by_fips(geojson):
+    return {feature['id']: feature for feature in geojson['features']}
+
+
+def for_fips(index, fips):
+    '''
+    FeatureCollection of just the given counties, for maps that only show a few.
+    '''
+    return {'type': 'FeatureCollection',
+            'features': [index[f] for f in dict.fromkeys(fips) if f in index]}
+
+
+def load_county_boundaries(url, state_fips=STATE_FIPS, precision=None,
+                           cache_dir=fetch_cache.CACHE_DIR, timeout=fetch_cache.TIMEOUT):
+    '''
+    County boundaries of the given states indexed by FIPS, optionally simplified to
+    `precision` decimals, and the SHA-1 of the upstream GeoJSON they come from (for
+    figure cache keys). The subset is written next to the cached GeoJSON and reused
+    until the upstream file changes, so the nationwide file is only parsed then. The
+    index is also kept in memory for as long as the upstream body stays the same.
+    '''
+    key = (url, tuple(state_fips), precision)
+    content, changed = fetch_cache.fetch(url, cache_dir, timeout=timeout)
+    digest = hashlib.sha1(content).hexdigest()
+    if key in _loaded and _loaded[key][1] == digest:
+        return _loaded[key]
+
+    path = fetch_cache.cache_path(url, '.' + '-'.join(state_fips) + '.' + str(precision) + '.geojson', cache_dir)
+    if not changed and os.path.exists(path):
+        with open(path) as f:
+            geojson = json.load(f)
+    else:
+        logging.debug('Building county boundaries for states ' + ', '.join(state_fips))
+        geojson = subset(json.loads(content), state_fips, precision)
+        storage.write_bytes(path, json.dumps(geojson, separators=(',', ':')))
+        fetch_cache.mark_read(url, cache_dir)
+
+    _loaded[key] = (index_by_fips(geojson), digest)
+    return _loaded[key]
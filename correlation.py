@@ -0,0 +1,152 @@
+import logging
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+import fetch_cache
+import master_store
+import positivity
+
+OUTPUT_PATH = './cache/correlation.npz'
+COLUMN = '14d_pp'
+WINDOW = 28
+MAX_LAG = 14
+SINCE = '2020-09-12'
+
+
+def pivot(data, column=COLUMN, since=SINCE):
+    '''
+    Dates x counties matrix of column, oldest date first. Days a county did not
+    report are NaN.
+    '''
+    data = data[data['county_nam'] != 'Arkansas_all_counties']
+    if since is not None:
+        data = data[data['mydate'] > since]
+    table = data.pivot(index='mydate', columns='county_nam', values=column).sort_index()
+    table.columns = [str(county) for county in table.columns]
+    return table
+
+
+def rolling_cross(x, y, window):
+    '''
+    Pearson correlation of every column of x with every column of y over each window
+    of `window` consecutive rows, as an array of shape (windows, x columns, y columns).
+    Pairs are computed over the rows where both values are present, like
+    DataFrame.corr. The pairwise sums are kept as running totals: each step adds the
+    row entering the window and subtracts the one leaving it, O(columns^2) per step.
+    '''
+    # centering keeps the running sums small, so adding and subtracting rows loses no precision
+    x = x - np.nanmean(x, axis=0)
+    y = y - np.nanmean(y, axis=0)
+    mx = ~np.isnan(x)
+    my = ~np.isnan(y)
+    x = np.where(mx, x, 0.0)
+    y = np.where(my, y, 0.0)
+    mx = mx.astype(float)
+    my = my.astype(float)
+
+    def terms(rows):
+        # n, sum x, sum y, sum x^2, sum y^2 and sum xy over the rows where both are present
+        return [mx[rows].T @ my[rows], x[rows].T @ my[rows], mx[rows].T @ y[rows],
+                (x[rows] ** 2).T @ my[rows], mx[rows].T @ (y[rows] ** 2), x[rows].T @ y[rows]]
+
+    def pearson(n, sx, sy, sxx, syy, sxy):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cov = sxy - sx * sy / n
+            var = (sxx - sx ** 2 / n) * (syy - sy ** 2 / n)
+            corr = cov / np.sqrt(var)
+        corr[n < 2] = np.nan
+        return np.clip(corr, -1.0, 1.0)
+
+    n_windows = len(x) - window + 1
+    result = np.full((max(n_windows, 0), x.shape[1], y.shape[1]), np.nan, dtype=np.float32)
+    if n_windows <= 0:
+        return result
+    sums = terms(slice(0, window))
+    result[0] = pearson(*sums)
+    for t in range(window, len(x)):
+        for total, entering, leaving in zip(sums, terms(slice(t, t + 1)), terms(slice(t - window, t - window + 1))):
+            total += entering - leaving
+        result[t - window + 1] = pearson(*sums)
+    return result
+
+
+def rolling_corr(table, window=WINDOW):
+    '''
+    Correlation matrices of all county pairs over a rolling window, indexed by the
+    last date of each window.
+    '''
+    return rolling_cross(table.to_numpy(dtype=float), table.to_numpy(dtype=float), window), table.index[window - 1:]
+
+
+def corr(table):
+    '''
+    Correlation matrix over the whole period, as a frame like table.corr().
+    '''
+    values = table.to_numpy(dtype=float)
+    matrix = rolling_cross(values, values, len(values))[0]
+    return pd.DataFrame(matrix, index=table.columns, columns=table.columns)
+
+
+def lagged_corr(table, max_lag=MAX_LAG, window=None):
+    '''
+    Cross-correlation of each county with every county `lag` days later, for lags
+    0..max_lag: element [lag, i, j] correlates county i with county j shifted back
+    by lag days, so high values for i leading j point from i to j. Without a window
+    the whole period is used, with one the result has an extra axis of windows.
+    '''
+    values = table.to_numpy(dtype=float)
+    results = []
+    for lag in range(max_lag + 1):
+        x = values[:len(values) - lag]
+        y = values[lag:]
+        result = rolling_cross(x, y, window or len(x))
+        results.append(result if window else result[0])
+    return results if window else np.stack(results)
+
+
+def compute(data, cfg=None):
+    '''
+    Rolling and lagged correlation of column between all counties, as configured in
+    the correlation section of config.yaml, saved to one .npz file.
+    '''
+    cfg = cfg or {}
+    table = pivot(data, cfg.get('column', COLUMN), cfg.get('since', SINCE))
+    window = cfg.get('window', WINDOW)
+    max_lag = cfg.get('max_lag', MAX_LAG)
+    logging.debug('Correlating ' + str(table.shape[1]) + ' counties over ' + str(table.shape[0]) + ' days')
+
+    rolling, window_ends = rolling_corr(table, window)
+    results = {'counties': np.array(list(table.columns), dtype=str),
+               'dates': table.index.values,
+               'corr': corr(table).to_numpy(),
+               'rolling': rolling,
+               'rolling_dates': window_ends.values,
+               'lagged': lagged_corr(table, max_lag),
+               'window': window}
+
+    output = cfg.get('output', OUTPUT_PATH)
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    np.savez_compressed(output, **results)
+    logging.info('Correlations written to ' + output)
+    return results
+
+
+def main(config_path='./config.yaml'):
+    # post_stats imports this module, so it is only imported when run as a script
+    import post_stats
+    cfg = post_stats.load_config(config_path)
+    post_stats.configure_logging(cfg, name='correlation')
+
+    periods = cfg.get('positivity_periods', positivity.PERIODS)
+    data = master_store.load_master(cfg['urls']['ar_covid'],
+                                    cfg.get('master_store', master_store.STORE_PATH),
+                                    cfg.get('cache_dir', fetch_cache.CACHE_DIR),
+                                    periods)
+    compute(data, cfg.get('correlation', {}))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,45 @@
+import logging
+import sys
+import time
+
+import post_stats
+
+
+def poll(runner, interval, runs=None):
+    '''
+    Run the report, or the ReportSet of all profiles, every `interval` seconds in
+    this process. The master frame, the parsed Rt data and the figure cache stay
+    loaded between runs, and unchanged upstream files cost one conditional GET each.
+    '''
+    reports = getattr(runner, 'reports', [runner])
+    # the daemon only publishes new data dates, never a "no new data" summary per poll
+    for report in reports:
+        report.post_negative_results = False
+    n = 0
+    while runs is None or n < runs:
+        n += 1
+        try:
+            runner.run()
+            for report in reports:
+                if report.published:
+                    logging.info('Published ' + (report.name + ' ' if report.name else '') + 'summary for ' + str(report.data_date))
+        except Exception:
+            # one failed poll (network, bad upstream data, a failing profile) must not stop the daemon
+            logging.exception('Poll failed, retrying in ' + str(interval) + 's')
+        if runs is None or n < runs:
+            time.sleep(interval)
+
+
+def main(config_path='./config.yaml'):
+    cfg = post_stats.load_config(config_path)
+    post_stats.configure_logging(cfg)
+    interval = cfg.get('daemon', {}).get('interval', 900)
+    logging.info('Polling for new data every ' + str(interval) + 's')
+    try:
+        poll(post_stats.make_report(cfg), interval)
+    except KeyboardInterrupt:
+        logging.info('Stopped')
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
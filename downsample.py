@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+
+import storage
+
+
+def lttb(x, y, points):
+    '''
+    Indices of the `points` rows of (x, y), x ascending, that
+    largest-triangle-three-buckets keeps: the first and the last row and, from each
+    of points - 2 equal buckets in between, the row forming the largest triangle
+    with the row kept before it and the mean of the next bucket.
+    '''
+    n = len(x)
+    if points is None or points >= n or points < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    # bucket i holds rows edges[i]..edges[i + 1]; the last row stands alone as the bucket after the last
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    counts = np.diff(np.r_[edges, n])
+    mean_x = np.add.reduceat(x, edges) / counts
+    mean_y = np.add.reduceat(y, edges) / counts
+
+    kept = np.empty(points, dtype=np.int64)
+    kept[0] = 0
+    kept[-1] = n - 1
+    a = 0
+    for i in range(points - 2):
+        start, stop = edges[i], edges[i + 1]
+        area = np.abs((x[a] - mean_x[i + 1]) * (y[start:stop] - y[a]) - (x[a] - x[start:stop]) * (mean_y[i + 1] - y[a]))
+        a = start + int(np.argmax(area))
+        kept[i + 1] = a
+    return kept
+
+
+def rows(frame, x, y, points=None, by=None):
+    '''
+    frame reduced to about `points` rows per trace (per value of column `by`) with
+    lttb over columns x and y, sorted by trace and x. The first, last, smallest and
+    largest y of every trace are always kept, so annotated extremes stay on the
+    line. Rows without y are dropped. Without points, frame is returned as it is.
+    '''
+    if not points:
+        return frame
+    frame = frame.sort_values(by=[x] if by is None else [by, x])
+    xs = frame[x].to_numpy()
+    if np.issubdtype(xs.dtype, np.datetime64):
+        xs = xs.astype('datetime64[ns]').astype(np.int64)
+    ys = frame[y].to_numpy(dtype=float)
+
+    # every trace is a row range of the sorted frame
+    starts, stops = np.array([0]), np.array([len(frame)])
+    if by is not None and len(frame):
+        starts, stops = storage.row_ranges(pd.factorize(frame[by])[0])
+
+    kept = []
+    for start, stop in zip(starts, stops):
+        valid = start + np.flatnonzero(~np.isnan(ys[start:stop]))
+        if len(valid) <= points:
+            kept.append(valid)
+            continue
+        # two of the budget are left for the extremes, which lttb may not pick
+        selected = valid[lttb(xs[valid], ys[valid], max(points - 2, 3))]
+        extremes = valid[[np.argmin(ys[valid]), np.argmax(ys[valid])]]
+        kept.append(np.union1d(selected, extremes))
+    return frame.iloc[np.concatenate(kept)]
@@ -0,0 +1,177 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import metrics
+import storage
+
+CACHE_DIR = './cache'
+TIMEOUT = 60
+
+_session = None
+_session_lock = threading.Lock()
+_prefetched = {}
+
+
+def make_session(pool_size=10, retries=3, backoff=0.5):
+    '''
+    requests session with a shared connection pool and retries with exponential
+    backoff on connection errors and 429/5xx responses. gzip/deflate transfer
+    encodings are requested and decoded (also when streaming) by requests.
+    '''
+    retry = Retry(total=retries, backoff_factor=backoff,
+                  status_forcelist=[429, 500, 502, 503, 504],
+                  allowed_methods=['GET', 'HEAD'])
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['Accept-Encoding'] = 'gzip, deflate'
+    return session
+
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = make_session()
+        return _session
+
+
+def cache_path(url, suffix, cache_dir=CACHE_DIR):
+    key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, key + suffix)
+
+
+def _read_meta(meta_path):
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+def _fetch(url, cache_dir=CACHE_DIR, session=None, timeout=TIMEOUT):
+    '''
+    The request behind fetch() and prefetch(). A body that changed stays marked
+    unread in the metadata until mark_read(), so a change downloaded by a prefetch
+    nobody consumed, or by a run that failed before storing it, is still reported
+    as changed later.
+    '''
+    session = session or get_session()
+    os.makedirs(cache_dir, exist_ok=True)
+    body_path = cache_path(url, '.body', cache_dir)
+    meta_path = cache_path(url, '.meta.json', cache_dir)
+
+    meta = {}
+    headers = {}
+    if os.path.exists(body_path) and os.path.exists(meta_path):
+        meta = _read_meta(meta_path)
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    with metrics.stage('fetch'):
+        r = session.get(url, headers=headers, timeout=timeout)
+        if r.status_code == 304 and headers:
+            logging.debug('Not modified, using cached copy of ' + url)
+            with open(body_path, 'rb') as f:
+                return f.read(), meta.get('unread', False)
+
+        r.raise_for_status()
+        content = r.content
+    metrics.count('fetch', bytes=len(content))
+    digest = hashlib.sha1(content).hexdigest()
+    # Servers that ignore the validators still send an identical body
+    modified = meta.get('sha1') != digest
+
+    if modified:
+        # drop anything derived from the previous body (e.g. parsed frames)
+        for derived in glob.glob(cache_path(url, '.*', cache_dir)):
+            if derived not in (body_path, meta_path):
+                os.remove(derived)
+        storage.write_bytes(body_path, content)
+    meta = {
+        'url': url,
+        'etag': r.headers.get('ETag'),
+        'last_modified': r.headers.get('Last-Modified'),
+        'sha1': digest,
+        'unread': modified or meta.get('unread', False)
+    }
+    storage.write_bytes(meta_path, json.dumps(meta).encode('utf-8'))
+    return content, meta['unread']
+
+
+def fetch(url, cache_dir=CACHE_DIR, session=None, timeout=TIMEOUT):
+    '''
+    Conditional GET backed by an on-disk cache.
+    The ETag/Last-Modified validators of the last 200 response are replayed on the
+    next request; a 304 serves the cached body instead of downloading it again.
+    Returns (content, changed) where changed stays True until the consumer calls
+    mark_read() once it stored what it derived from the body. A result of
+    prefetch() is handed out once.
+    '''
+    result = _prefetched.pop((url, cache_dir), None)
+    if result is None:
+        result = _fetch(url, cache_dir, session, timeout)
+    return result
+
+
+def mark_read(url, cache_dir=CACHE_DIR):
+    '''
+    Record that the current body of url was consumed, so fetch() reports it as
+    unchanged from now on. Call it after the result is safely written; a run that
+    fails before gets the body as changed again.
+    '''
+    meta_path = cache_path(url, '.meta.json', cache_dir)
+    if not os.path.exists(meta_path):
+        return
+    meta = _read_meta(meta_path)
+    if meta.get('unread'):
+        meta['unread'] = False
+        storage.write_bytes(meta_path, json.dumps(meta).encode('utf-8'))
+
+
+def cached_sha1(url, cache_dir=CACHE_DIR):
+    '''
+    SHA-1 of the cached body of url, without a request. None when url was never
+    fetched.
+    '''
+    meta_path = cache_path(url, '.meta.json', cache_dir)
+    if not os.path.exists(meta_path):
+        return None
+    return _read_meta(meta_path).get('sha1')
+
+
+def prefetch(urls, cache_dir=CACHE_DIR, timeouts=None, session=None):
+    '''
+    Fetch all urls concurrently over one pooled session. The results are kept for
+    the next fetch() of each url in this process, so callers can stay sequential
+    while the downloads overlap. timeouts maps url to seconds. Results nobody
+    fetched are dropped by clear_prefetched() at the end of a run.
+    '''
+    timeouts = timeouts or {}
+    session = session or get_session()
+    with ThreadPoolExecutor(max_workers=max(len(urls), 1)) as executor:
+        futures = {url: executor.submit(_fetch, url, cache_dir, session, timeouts.get(url, TIMEOUT))
+                   for url in urls}
+    for url, future in futures.items():
+        try:
+            _prefetched[(url, cache_dir)] = future.result()
+        except requests.RequestException:
+            # leave it to the regular fetch() to retry and raise
+            logging.exception('Prefetch of ' + url + ' failed')
+
+
+def clear_prefetched():
+    '''
+    Drop the prefetched results that were not fetched, so the next run requests
+    them again. Changed bodies among them are still reported as changed then.
+    '''
+    _prefetched.clear()
@@ -0,0 +1,296 @@
+import logging
+from datetime import datetime
+
+import numpy as np
+import seaborn
+import matplotlib.pyplot as plt
+import plotly.graph_objects as go
+import plotly.express as px
+from plotly.subplots import make_subplots
+
+import correlation
+import downsample
+
+def generate_line(df, who_t, renderer, points=None):
+    '''
+    points, when given, is the budget of points per county line (see downsample.rows).
+    '''
+    df = df[df['mydate'] > '2020-09-12']
+    df = downsample.rows(df, 'mydate', '14d_pp', points, 'county_nam')
+    fig = px.line(df, x='mydate', y='14d_pp',
+              color="county_nam",
+              line_group="county_nam",
+              hover_name="county_nam",
+              labels={
+                  "14d_pp": "Positivity Rate",
+                  "mydate": "Date"
+                  })
+    fig.update_traces(line=dict(width=4))
+
+    fig.add_shape(type='line',
+                x0=0,
+                y0=who_t,
+                x1=1,
+                y1=who_t,
+                line=dict(color='Red',dash="dot", width=4),
+                xref='paper',
+                yref='y')
+
+    fig.add_annotation(text="WHO Recommended Threshold",
+                  xref="paper", yref="y",
+                  x=1, y=who_t + .002, showarrow=False,
+                  font=dict(color="red",size=10)
+                  )
+
+    fig.update_layout(title='14 Day Average Test Positivity Rate Over Time',
+                      showlegend=True,
+                      legend_title_text='County',
+                      yaxis_tickformat = '.2%',
+                      font=dict(size=16))
+    renderer.add_plotly('line', fig)
+    return fig
+
+def generate_bullet(df, counties, who_t, renderer):
+    fig = go.Figure()
+
+    y1 = 0.1
+    y2 = 0.2
+    row_date = None
+    axis_visible = True
+    for county in counties:
+        county_data = df[df['county_nam'] == county]
+        row1 = county_data.iloc[0]
+        row_date = row1['mydate'].strftime('%A, %b %d, %Y')
+        pp_last_fourteen_days = row1['14d_pp']
+        fig.add_trace(go.Indicator(
+            mode = "number+gauge+delta", value = pp_last_fourteen_days,
+            delta = {'reference': who_t},
+            domain = {'x': [0.1, 1], 'y': [y1, y2]},
+            title = {'text': str(county) + " County"},
+            gauge = {
+                'shape': "bullet",
+                'axis': {'range': [None, .2], 'visible': axis_visible},
+                'threshold': {
+                    'line': {'color': "red", 'width': 2},
+                    'thickness': 1,
+                    'value': who_t},
+                'bar': {'color': "black"},
+                'bgcolor': 'LightGrey'}))
+        y1 += 0.12
+        y2 += 0.12
+        axis_visible = False
+
+    fig.update_traces(number_valueformat='.2%', selector=dict(type='indicator'))
+    fig.update_traces(gauge_axis_tickformat='.2%', selector=dict(type='indicator'))
+    fig.update_traces(delta_valueformat='.2%', selector=dict(type='indicator'))
+    fig.update_traces(delta_increasing_color='#FF0000', selector=dict(type='indicator'))
+    fig.update_traces(delta_decreasing_color='#00FF00', selector=dict(type='indicator'))
+    fig.update_yaxes(automargin=True)
+
+    fig.add_annotation(x=-1, y=4,
+            text="Text annotation without arrow",
+            showarrow=False,
+            yshift=10)
+
+    fig.update_layout(
+        title={
+            'text': "14 Day Test Positivity Rate (" + row_date + ")",
+            'y':y1,
+            'x':0.5,
+            'xanchor': 'center',
+            'yanchor': 'top'},
+        autosize=True,
+        width=1300,
+        height=729
+    )
+
+
+    renderer.add_plotly('bullet', fig)
+    return fig
+
+def generate_xkcd_graph(df, renderer, points=None):
+    df = downsample.rows(df, 'mydate', 'active_cases', points)
+    with plt.xkcd():
+        ax = df.plot(x ='mydate', y='active_cases', kind = 'line', grid = True, title = 'active covid 19 cases in union county over time', legend = False, figsize = [16, 9])
+        ax.set_xlabel("date")
+        ax.set_ylabel("active cases")
+        ax.grid(True, linewidth=1)
+
+        line_annotation1 = datetime(2020, 9, 13)
+        line_annotation2 = datetime(2020, 11, 7)
+        line_annotation3 = datetime(2020, 10, 13)
+        ax.annotate('', xy=(line_annotation1, 90), xytext=(line_annotation2, 90), xycoords='data', textcoords='data', arrowprops={'arrowstyle': '|-|'})
+        ax.annotate('period of calm and preparation', xy=(line_annotation3, 98), ha='center', va='center')
+
+        # Annotate
+        x_line_annotation = datetime(2020, 11, 26)
+
+        ax.annotate('violent ritual involving maskless\nfamily gatherings and gorging on the \ncorpse of a turkey',
+                    xy=(x_line_annotation, 117),
+                    xycoords='data',
+                    xytext=(-50,-75),
+                    textcoords='offset points',
+                    arrowprops=dict(headwidth=5, width=2, color='#363d46', connectionstyle="angle3,angleA=0,angleB=-90"),
+                    fontsize=12)
+        # Annotate
+        x_line_annotation = datetime(2021, 1, 2)
+
+        ax.annotate('SURPRISE!\na 190% increase since\nmurdering the turkey',
+                    xy=(x_line_annotation, 365),
+                    xycoords='data',
+                    xytext=(-180,-35),
+                    textcoords='offset points',
+                    arrowprops=dict(headwidth=5, width=2, color='#363d46', connectionstyle="angle3,angleA=0,angleB=-90"),
+                    fontsize=12)
+
+        # Annotate
+        x_line_annotation = datetime(2020, 11, 14)
+
+        ax.annotate('warriors begin gathering at rustic shelters\nin groups to plot the mass murder of beasts\nwith white tails',
+                    xy=(x_line_annotation, 75),
+                    xycoords='data',
+                    xytext=(-40,-90),
+                    textcoords='offset points',
+                    arrowprops=dict(headwidth=5, width=2, color='#363d46', connectionstyle="angle3,angleA=0,angleB=-90"),
+                    fontsize=12)
+
+        # Annotate
+        x_line_annotation = datetime(2020, 12, 25)
+
+        ax.annotate('second, morbid ritual revolving around\nhanging ornaments and lights on the\ncorpse of a tree',
+                    xy=(x_line_annotation, 280),
+                    xycoords='data',
+                    xytext=(-290,-65),
+                    textcoords='offset points',
+                    arrowprops=dict(headwidth=5, width=2, color='#363d46', connectionstyle="angle3,angleA=0,angleB=90"),
+                    fontsize=12)
+
+        plt.gca().spines['top'].set_visible(False)
+        plt.gca().spines['right'].set_visible(False)
+        renderer.add_matplotlib('xkcd_graph', plt.gcf())
+
+def generate_state_cloropleth(latest_data, county_boundaries, min_cases, max_cases, renderer, name='state_map'):
+    fig = px.choropleth_mapbox(latest_data, geojson=county_boundaries, color='Active_Cases_10k_Pop',
+        locations='fips',
+        color_continuous_scale="portland",
+        range_color=[min_cases, max_cases],
+        mapbox_style='open-street-map',
+        center={'lat': 34.8938, 'lon': -92.4426},
+        zoom=6.8,
+        opacity=0.6,
+        title='Active Cases per 10k of Population (' + latest_data['mydate'].max().strftime('%A, %b %d, %Y') + ')',
+        hover_name='county_nam',
+        labels={'Active_Cases_10k_Pop': 'Active Cases/10k Population'})
+    fig.update_layout(margin={"r":10,"t":40,"l":10,"b":10})
+    renderer.add_plotly(name, fig)
+    return fig
+
+def generate_active_cases_graph(data, counties, renderer, grouped_df=None, points=None):
+    '''
+    grouped_df, when given, holds the precomputed regional active_cases sum and pp
+    mean per mydate (see regions.RegionalAggregates). points, when given, is the
+    budget of bars and of line points; the annotations are taken from all days.
+    '''
+    if grouped_df is None:
+        filtered_data = data[data['county_nam'].isin(counties)]
+        grouped_df = filtered_data.groupby(['mydate']).agg(
+            {
+                 'active_cases':sum,
+                 'pp': "mean"
+            }
+        ).reset_index()
+    grouped_df = grouped_df[(grouped_df['mydate'] > '2020-09-13')].reset_index(drop=True)
+
+    county_text = u', '.join(counties)
+
+    max_index = grouped_df.index.max()
+    max_date = max(grouped_df['mydate'])
+    last_pp = grouped_df.loc[max_index]['pp']
+    last_active = grouped_df.loc[max_index]['active_cases']
+
+    low_pp = min(grouped_df['pp'])
+    low_pp_index = grouped_df['pp'].idxmin()
+    low_pp_date = grouped_df.loc[low_pp_index]['mydate']
+
+    max_active = max(grouped_df['active_cases'])
+    max_active_index = grouped_df['active_cases'].idxmax()
+    max_active_date = grouped_df.loc[max_active_index]['mydate']
+
+
+    grouped_df['county_nam'] = 'All Counties'
+    grouped_df = grouped_df.sort_values(by=['mydate'], ascending=False)
+    bars = downsample.rows(grouped_df, 'mydate', 'active_cases', points)
+    pp_line = downsample.rows(grouped_df, 'mydate', 'pp', points)
+    bar_width = None
+    if points:
+        # each kept bar is as wide as the days up to the next one
+        dates = bars['mydate'].to_numpy()
+        bar_width = 0.8 * np.diff(dates, append=dates[-1] + np.timedelta64(1, 'D')) / np.timedelta64(1, 'ms')
+
+    # Create figure with secondary y-axis
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    # Add traces
+    fig.add_trace(
+        go.Bar(
+            x=bars['mydate'],
+            y=bars['active_cases'],
+            width=bar_width,
+            name="Active Cases",
+            marker=dict(color='rgba(100, 149, 237, .8)')),
+        secondary_y=False)
+
+    fig.add_trace(
+        go.Scatter(x=pp_line['mydate'],
+                   y=pp_line['pp'],
+                   name="Test Positivity",
+                   mode = 'lines',
+                   line=dict(shape='linear', color='rgba(237, 188, 100, 1)', width=4)),
+        secondary_y=True)
+
+    fig.update_xaxes(title_text="Date")
+    fig.update_yaxes(title_text="Active Cases", secondary_y=False)
+    fig.update_yaxes(title_text="Test Positivity Rate", secondary_y=True)
+
+    fig.update_layout(title='Active Cases, Test Positivity Rate, Six County Region <br>' + county_text,
+                      showlegend=True,
+                      yaxis2_tickformat = '.2%',
+                      font=dict(size=16))
+
+    fig.add_annotation(x=max_date, y=last_pp, text="{:.2%}".format(last_pp), xanchor='auto', xref="x", yref="y2", bgcolor='rgba(232, 168, 54, 1)', font=dict(color='Black'))
+    fig.add_annotation(x=low_pp_date, y=low_pp, text="Low Positivity Rate: " + "{:.2%}".format(low_pp), xanchor='auto', xref="x", yref="y2", bgcolor='rgba(232, 168, 54, 1)', font=dict(color='Black'))
+    fig.add_annotation(x=max_date, y=last_active, text=str(last_active), xanchor='auto', xref="x", yref="y", bgcolor='rgba(54, 118, 232, 1)', font=dict(color='Ivory'))
+    fig.add_annotation(x=max_active_date, y=max_active, text='Max Active Cases: ' + str(max_active), xanchor='auto', xref="x", yref="y", bgcolor='rgba(54, 118, 232, 1)', font=dict(color='Ivory'))
+    renderer.add_plotly('active_cases_graph', fig)
+    return fig
+
+def generate_county_cases(df, title, renderer, x='mydate', name='county_cases'):
+    '''
+    Daily new cases of one county as bars with their 7 day average, for the batch
+    mode. x is the date column (mydate in the master file, date in the NYT data).
+    '''
+    df = df.sort_values(by=[x])
+    average = df['New_Cases_Today'].rolling(7, min_periods=1).mean()
+    fig = go.Figure()
+    fig.add_trace(go.Bar(x=df[x], y=df['New_Cases_Today'], name='New Cases',
+                         marker=dict(color='rgba(100, 149, 237, .8)')))
+    fig.add_trace(go.Scatter(x=df[x], y=average, name='7 Day Average', mode='lines',
+                             line=dict(color='rgba(237, 188, 100, 1)', width=4)))
+    fig.update_layout(title='New Cases, ' + title, showlegend=True, font=dict(size=16))
+    fig.update_xaxes(title_text="Date")
+    fig.update_yaxes(title_text="New Cases")
+    renderer.add_plotly(name, fig)
+    return fig
+
+def generate_correlation_matrix(full_data, renderer):
+    #initial experiments with Pearson Correlation
+    corr_df = correlation.corr(correlation.pivot(full_data, '14d_pp', '2020-09-12'))
+    logging.debug(corr_df.head(10))
+    #take the bottom triangle since it repeats itself
+    mask = np.zeros_like(corr_df)
+    mask[np.triu_indices_from(mask)] = True
+    #generate plot
+    seaborn.heatmap(corr_df, cmap='RdYlGn', vmax=1.0, vmin=-1.0 , mask = mask, linewidths=2.5)
+    plt.yticks(rotation=0)
+    plt.xticks(rotation=90)
+    renderer.add_matplotlib('correlation_matrix', plt.gcf())
+    return corr_df
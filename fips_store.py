@@ -0,0 +1,188 @@
+import logging
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+
+import metrics
+import run_state
+import storage
+
+FIPS_PATH = './cache/fips.feather'
+KEYS = ['fips', 'date']
+SOURCES = ('ar', 'nyt')
+
+
+def from_master(data):
+    '''
+    Cumulative cases and deaths of the Arkansas master file, keyed by fips and date.
+    '''
+    data = data[data['county_nam'] != 'Arkansas_all_counties']
+    return pd.DataFrame({'fips': data['fips'].astype(str).to_numpy(),
+                         'date': data['mydate'].to_numpy(),
+                         'county': data['county_nam'].astype(str).to_numpy(),
+                         'cases': data['positive'].to_numpy(),
+                         'deaths': data['deaths'].to_numpy()})
+
+
+def from_nyt(data):
+    '''
+    Cumulative cases and deaths of the NYT county data. Rows without a fips
+    ("Unknown" counties, New York City) cannot be joined and are left out.
+    '''
+    fips = pd.to_numeric(data['fips'], errors='coerce')
+    data = data[fips.notna()]
+    return pd.DataFrame({'fips': fips[fips.notna()].astype(np.int64).astype(str).str.zfill(5).to_numpy(),
+                         'date': pd.to_datetime(data['date']).to_numpy(),
+                         'county': data['county'].astype(str).to_numpy(),
+                         'cases': data['cases'].to_numpy(),
+                         'deaths': data['deaths'].to_numpy()})
+
+
+CONVERTERS = {'ar': from_master, 'nyt': from_nyt}
+
+
+class FipsIndex(storage.SortedIndex):
+    '''
+    Cases and deaths of every source side by side, one row per (fips, date) and
+    sorted by it: <source>_cases and <source>_deaths, missing where a source has
+    no row. The sources need no join, they are already aligned.
+    '''
+    key = 'fips'
+
+    def fips(self):
+        return self.keys()
+
+    def sources(self):
+        return [source for source in SOURCES if source + '_cases' in self.frame.columns]
+
+    def max_date(self, source):
+        column = source + '_cases'
+        if column not in self.frame.columns:
+            return None
+        return self.frame.loc[self.frame[column].notna(), 'date'].max()
+
+    def at(self, fips, date):
+        i = self.search(fips, date)
+        if i == self.bounds[fips][1] or self.dates[i] != np.datetime64(pd.Timestamp(date)):
+            raise KeyError('No data for ' + fips + ' on ' + str(date))
+        return self.frame.iloc[i]
+
+    def compare(self, start_date=None, end_date=None, left='ar', right='nyt'):
+        '''
+        The days both sources report for a county, with the differences
+        cases_diff and deaths_diff (left minus right).
+        '''
+        frame = self.frame
+        mask = frame[left + '_cases'].notna() & frame[right + '_cases'].notna()
+        if start_date is not None:
+            mask &= frame['date'] >= pd.Timestamp(start_date)
+        if end_date is not None:
+            mask &= frame['date'] <= pd.Timestamp(end_date)
+        joined = frame.loc[mask, KEYS + ['county', left + '_cases', right + '_cases', left + '_deaths', right + '_deaths']]
+        joined['cases_diff'] = joined[left + '_cases'] - joined[right + '_cases']
+        joined['deaths_diff'] = joined[left + '_deaths'] - joined[right + '_deaths']
+        return joined
+
+
+def read_index(path=FIPS_PATH):
+    if not os.path.exists(path):
+        return FipsIndex(pd.DataFrame({'fips': pd.Series(dtype=str), 'date': pd.Series(dtype='datetime64[ns]'),
+                                       'county': pd.Series(dtype=str)}))
+    return FipsIndex(feather.read_table(path, memory_map=True).to_pandas())
+
+
+def upsert(source, rows, path=FIPS_PATH, index=None):
+    '''
+    Write the cases and deaths of one source (rows as from_master/from_nyt return
+    them) into the store. Rows replace the source's values on the same (fips,
+    date); other sources are left as they are. Returns the updated FipsIndex.
+    '''
+    if index is None:
+        index = read_index(path)
+    new = rows.rename(columns={'cases': source + '_cases', 'deaths': source + '_deaths'}).set_index(KEYS)
+    for column in (source + '_cases', source + '_deaths'):
+        new[column] = new[column].astype('Int32')
+    frame = new.combine_first(index.frame.set_index(KEYS)).reset_index()
+    columns = [source + measure for source in SOURCES for measure in ('_cases', '_deaths')]
+    index = FipsIndex(frame[KEYS + ['county'] + [column for column in columns if column in frame.columns]])
+
+    storage.write_feather(index.frame, path)
+    return index
+
+
+def changed_rows(index, source, rows):
+    '''
+    The rows (as from_master/from_nyt return them) that the store lacks for source
+    or has with other cases or deaths. Both sources revise past days: the NYT its
+    recent ones, Arkansas with corrections and counties that report late.
+    '''
+    if source + '_cases' not in index.frame.columns:
+        return rows
+    keys = pd.MultiIndex.from_frame(rows[KEYS])
+    stored = index.frame.set_index(KEYS)[[source + '_cases', source + '_deaths']].reindex(keys)
+    differs = np.zeros(len(rows), dtype=bool)
+    for measure in ('cases', 'deaths'):
+        new = rows[measure].to_numpy(dtype=float)
+        old = stored[source + '_' + measure].to_numpy(dtype=float, na_value=np.nan)
+        differs |= ~((new == old) | (np.isnan(new) & np.isnan(old)))
+    return rows[differs]
+
+
+def update_source(source, data, path=FIPS_PATH):
+    '''
+    Bring the store up to date with a source's frame (the master frame for 'ar',
+    the NYT county data for 'nyt'). Only the rows that are new or changed, on any
+    date, are written. The store is re-read under a lock, as post_stats and
+    process_nyt_data write it separately.
+    '''
+    with run_state.locked(path):
+        index = read_index(path)
+        rows = changed_rows(index, source, CONVERTERS[source](data))
+        if rows.empty:
+            return index
+        logging.debug('Writing ' + str(len(rows)) + ' ' + source + ' rows to ' + path)
+        with metrics.stage('fips_store'):
+            index = upsert(source, rows, path, index)
+        metrics.count('fips_store', rows=len(rows))
+    return index
+
+
+def reconcile(index, date=None):
+    '''
+    The counties whose Arkansas and NYT numbers differ on date (default: the newest
+    day both report).
+    '''
+    if len(index.sources()) < 2:
+        return index.frame.iloc[:0]
+    if date is None:
+        common = index.compare()
+        if common.empty:
+            return common
+        date = common['date'].max()
+    joined = index.compare(date, date)
+    return joined[(joined['cases_diff'] != 0) | (joined['deaths_diff'] != 0)]
+
+
+def main(config_path='./config.yaml'):
+    # post_stats imports this module, so it is only imported when run as a script
+    import post_stats
+    cfg = post_stats.load_config(config_path)
+    post_stats.configure_logging(cfg, name='fips_store')
+
+    index = read_index(cfg.get('fips_store') or FIPS_PATH)
+    if len(index.sources()) < 2:
+        logging.info('Only ' + ', '.join(index.sources()) + ' data stored, run post_stats.py and process_nyt_data.py first')
+        return
+    differences = reconcile(index)
+    if differences.empty:
+        logging.info('Arkansas and NYT numbers agree')
+    for row in differences.itertuples():
+        logging.info('{} ({}) on {}: cases {:+}, deaths {:+}'.format(
+            row.county, row.fips, row.date.strftime('%Y-%m-%d'), row.cases_diff, row.deaths_diff))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
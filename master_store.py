@@ -0,0 +1,164 @@
+import io
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow.compute as pc
+import pyarrow.feather as feather
+
+import fetch_cache
+import metrics
+import positivity
+import storage
+
+STORE_PATH = './cache/master_file.feather'
+
+
+def normalize(data):
+    '''
+    Type the raw master file columns: datetime mydate, state-prefixed fips and
+    categorical county names.
+    '''
+    # the file repeats a few hundred distinct date strings, so parse those once
+    dates = data['mydate'].unique()
+    data['mydate'] = data['mydate'].map(dict(zip(dates, pd.to_datetime(dates))))
+    # Prepending the state FIPS number to the county FIPS number for geojson indexing purposes
+    data['fips'] = '05' + data['fips'].astype(str).str.zfill(3)
+    data['county_nam'] = data['county_nam'].astype('category')
+    return data
+
+
+def compact(data):
+    '''
+    Shrink the frame in place: int32 counts, float32 rates and categorical text
+    columns (county_nam, fips) instead of int64/float64 and repeated strings.
+    Counts stay at least 32 bit so differences and sums of them can not overflow.
+    '''
+    int32 = np.iinfo(np.int32)
+    for column in data.columns:
+        values = data[column]
+        if column == 'mydate' or isinstance(values.dtype, pd.CategoricalDtype):
+            continue
+        if pd.api.types.is_integer_dtype(values.dtype):
+            if values.empty or (values.min() >= int32.min and values.max() <= int32.max):
+                data[column] = values.astype(np.int32)
+        elif pd.api.types.is_float_dtype(values.dtype):
+            data[column] = values.astype(np.float32)
+        elif pd.api.types.is_string_dtype(values.dtype) and values.nunique() <= len(values) // 2:
+            data[column] = values.astype('category')
+    return data
+
+
+def memory_report(data):
+    '''
+    Bytes per column (including the strings of object columns) and their total.
+    '''
+    usage = data.memory_usage(index=True, deep=True)
+    report = pd.DataFrame({'dtype': [str(data.index.dtype)] + [str(dtype) for dtype in data.dtypes],
+                           'bytes': usage.values}, index=usage.index)
+    report.loc['total'] = ['', usage.sum()]
+    return report
+
+
+def county_slices(data):
+    '''
+    Row range of every county in a frame sorted by (county_nam, mydate), as written
+    by write_store. data.iloc[county_slices(data)[county]] selects a county without
+    filtering or copying the frame, and [::-1] on it gives the newest day first.
+    '''
+    codes = data['county_nam'].cat.codes.to_numpy()
+    starts, stops = storage.row_ranges(codes)
+    names = data['county_nam'].cat.categories
+    return {str(names[codes[start]]): slice(start, stop) for start, stop in zip(starts, stops)}
+
+
+def read_store(path=STORE_PATH):
+    # stores written before compact() are converted on read
+    return compact(feather.read_table(path, memory_map=True).to_pandas())
+
+
+def write_store(data, path=STORE_PATH):
+    data = compact(data.sort_values(by=['county_nam', 'mydate'], ignore_index=True))
+    storage.write_feather(data, path)
+    return data
+
+
+def latest_date(path=STORE_PATH):
+    '''
+    Newest mydate in the store, reading only that column.
+    '''
+    dates = feather.read_table(path, columns=['mydate'], memory_map=True).column('mydate')
+    return pd.Timestamp(pc.max(dates).as_py())
+
+
+def update_store(url, path=STORE_PATH, cache_dir=fetch_cache.CACHE_DIR, periods=positivity.PERIODS):
+    '''
+    Bring the store up to date with the upstream master file and return True when
+    rows were appended. Nothing is parsed when the upstream file is unchanged, and
+    otherwise only the (county, date) rows missing from the store are normalized
+    and get their derived columns computed. Counties that got a row older than
+    their newest stored day have their positivity recomputed.
+    '''
+    s, changed = fetch_cache.fetch(url, cache_dir)
+    stored = None
+    if os.path.exists(path):
+        if not changed:
+            logging.debug('Master file unchanged, store is current ' + path)
+            return False
+        stored = read_store(path)
+
+    with metrics.stage('parse'):
+        raw = pd.read_csv(io.BytesIO(s), index_col=0, dtype={"fips": str})
+    metrics.count('parse', rows=len(raw))
+    if stored is None or stored.empty:
+        with metrics.stage('positivity'):
+            data = positivity.calculate_positivity_rates(normalize(raw), periods)
+        metrics.count('positivity', rows=len(data))
+    else:
+        if any(str(period) + 'd_pp' not in stored.columns for period in periods):
+            stored = positivity.calculate_positivity_rates(stored, periods)
+        # rows are new by (county, date): a county may report a day the store already has for others
+        dates = raw['mydate'].unique()
+        raw_dates = raw['mydate'].map(dict(zip(dates, pd.to_datetime(dates))))
+        raw_keys = pd.MultiIndex.from_arrays([raw['county_nam'].astype(str), raw_dates])
+        stored_keys = pd.MultiIndex.from_arrays([stored['county_nam'].astype(str), stored['mydate']])
+        new_rows = raw[~raw_keys.isin(stored_keys)]
+        logging.info('Appending ' + str(len(new_rows)) + ' new master file rows')
+        if new_rows.empty:
+            fetch_cache.mark_read(url, cache_dir)
+            return False
+        new_rows = normalize(new_rows.copy())
+
+        # a late row changes the rolling windows of the days after it, so those counties are recomputed
+        stored_max = stored.groupby('county_nam', observed=True)['mydate'].max()
+        stored_max.index = stored_max.index.astype(str)
+        new_counties = new_rows['county_nam'].astype(str)
+        late = new_rows['mydate'] <= new_counties.map(stored_max)
+        late_counties = set(new_counties[late])
+        with metrics.stage('positivity'):
+            if late_counties:
+                logging.info('Recomputing positivity of ' + ', '.join(sorted(late_counties)) + ' for late rows')
+                stored_late = stored['county_nam'].astype(str).isin(late_counties)
+                new_late = new_counties.isin(late_counties)
+                redone = positivity.calculate_positivity_rates(
+                    pd.concat([stored[stored_late], new_rows[new_late]], ignore_index=True), periods)
+                stored = pd.concat([stored[~stored_late], redone], ignore_index=True)
+                new_rows = new_rows[~new_late]
+            new_rows = positivity.calculate_positivity_rates(new_rows, periods, stored)
+        metrics.count('positivity', rows=len(new_rows))
+        data = pd.concat([stored, new_rows])
+        data['county_nam'] = data['county_nam'].astype(str).astype('category')
+    write_store(data, path)
+    fetch_cache.mark_read(url, cache_dir)
+    return True
+
+
+def load_master(url, path=STORE_PATH, cache_dir=fetch_cache.CACHE_DIR, periods=positivity.PERIODS):
+    '''
+    Return the typed master frame, sorted by county and date.
+    The normalized frame is persisted as uncompressed Feather and memory-mapped on
+    later runs; see update_store.
+    '''
+    update_store(url, path, cache_dir, periods)
+    return read_store(path)
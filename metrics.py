@@ -0,0 +1,103 @@
+import contextlib
+import cProfile
+import json
+import logging
+import os
+import threading
+import time
+
+import storage
+
+_lock = threading.Lock()
+_stages = {}
+
+
+def reset():
+    with _lock:
+        _stages.clear()
+
+
+def _entry(name):
+    return _stages.setdefault(name, {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'bytes': 0, 'rows': 0})
+
+
+@contextlib.contextmanager
+def stage(name):
+    '''
+    Add the wall and CPU time of the block to the totals of stage `name`. Stages may
+    nest (fetch runs inside load), each keeps its own totals. CPU time is that of
+    the whole process, so threads running at the same time are included.
+    '''
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        yield
+    finally:
+        with _lock:
+            entry = _entry(name)
+            entry['calls'] += 1
+            entry['wall_seconds'] += time.perf_counter() - wall
+            entry['cpu_seconds'] += time.process_time() - cpu
+
+
+def count(name, bytes=0, rows=0):
+    with _lock:
+        entry = _entry(name)
+        entry['bytes'] += bytes
+        entry['rows'] += rows
+
+
+def snapshot():
+    with _lock:
+        return {name: dict(entry) for name, entry in _stages.items()}
+
+
+def to_json():
+    return json.dumps(snapshot(), indent=2, sort_keys=True)
+
+
+def to_prometheus(prefix='post_stats'):
+    '''
+    Prometheus text exposition of the stage totals, one gauge per measure labelled
+    by stage, for the node exporter textfile collector or a push gateway.
+    '''
+    stages = snapshot()
+    lines = []
+    for measure, kind in (('calls', 'calls'), ('wall_seconds', 'wall time'), ('cpu_seconds', 'CPU time'),
+                          ('bytes', 'bytes downloaded'), ('rows', 'rows processed')):
+        metric = prefix + '_stage_' + measure
+        lines.append('# HELP ' + metric + ' Stage ' + kind + ' of the last run.')
+        lines.append('# TYPE ' + metric + ' gauge')
+        for name in sorted(stages):
+            lines.append(metric + '{stage="' + name + '"} ' + repr(stages[name][measure]))
+    return '\n'.join(lines) + '\n'
+
+
+def write(json_path=None, prometheus_path=None):
+    if json_path:
+        storage.write_bytes(json_path, to_json())
+    if prometheus_path:
+        storage.write_bytes(prometheus_path, to_prometheus())
+    for name, entry in sorted(snapshot().items()):
+        logging.info('{}: {:.3f}s wall, {:.3f}s CPU, {} bytes, {} rows'.format(
+            name, entry['wall_seconds'], entry['cpu_seconds'], entry['bytes'], entry['rows']))
+
+
+@contextlib.contextmanager
+def profiled(path=None):
+    '''
+    Run the block under cProfile and dump the stats to path (for pstats or
+    snakeviz). Does nothing without a path.
+    '''
+    if not path:
+        yield
+        return
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        profile.dump_stats(path)
+        logging.info('Profile written to ' + path)
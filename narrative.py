@@ -0,0 +1,176 @@
+import html
+
+import numpy as np
+import pandas as pd
+
+import storage
+
+ACTIVE_CHANGED = u"There were {today} active cases in {county} County on {today_date}. This is {direction} of {difference} from the previous day's total of {yesterday}."
+ACTIVE_EQUAL = u"There were {today} active cases in {county} County on {today_date}. This is equal to the previous day's total."
+NEW_INFO = u"{new_cases_today} new cases were added and {new_recoveries_today} cases are considered newly recovered."
+NEW_DEATHS = u"Sadly, {new_deaths_today} more of our {county} County friends and neighbors have died due to COVID-19."
+NO_NEW_DEATHS = u"Fortunately, we have not lost any additional {county} County friends and neighbors to the virus."
+PCFR = u"The preliminary case fatality ratio in the County is currently {preliminary_cfr}"
+POSITIVITY = u"{pp_average} of tests in the County were positive over the last 14 days."
+
+FORMATS = ('text', 'markdown', 'html')
+
+def _metrics_table(latest, previous):
+    column = lambda rows, name, dtype=np.int64: rows[name].to_numpy(dtype=dtype)
+    table = pd.DataFrame({
+        'mydate': latest['mydate'].to_numpy(),
+        'today': column(latest, 'active_cases'),
+        'yesterday': column(previous, 'active_cases'),
+        'new_cases_today': column(latest, 'New_Cases_Today'),
+        'new_recoveries_today': column(latest, 'Recovered_Since_Yesterday'),
+        'new_deaths_today': column(latest, 'New_Deaths_Today'),
+        'total_cases': column(latest, 'positive'),
+        'total_deaths': column(latest, 'deaths'),
+        'pp14': column(latest, '14d_pp', float),
+    }, index=pd.Index([str(county) for county in latest['county_nam']], name='county'))
+    table['cfr'] = table['total_deaths'] / table['total_cases']
+    return table
+
+def county_metrics(data):
+    '''
+    One row per county with the numbers of its narrative: the newest day compared
+    with the day before, computed for all counties of data at once. Counties with
+    fewer than two days are left out.
+    '''
+    data = data.sort_values(by=['county_nam', 'mydate'])
+    starts, stops = storage.row_ranges(pd.factorize(data['county_nam'])[0])
+    # the last row of each county with a row before it
+    last = (stops - 1)[stops - starts > 1]
+    return _metrics_table(data.iloc[last], data.iloc[last - 1])
+
+def daily_metrics(data, start=None, end=None):
+    '''
+    Like county_metrics, but one row for every county and day between start and end
+    (inclusive), each compared with the county's previous day. Ordered by date,
+    then county.
+    '''
+    data = data.sort_values(by=['county_nam', 'mydate'])
+    starts, _ = storage.row_ranges(pd.factorize(data['county_nam'])[0])
+    dates = data['mydate'].to_numpy()
+    # every row but the first of its county
+    rows = np.setdiff1d(np.arange(len(data)), starts)
+    if start is not None:
+        rows = rows[dates[rows] >= np.datetime64(pd.Timestamp(start))]
+    if end is not None:
+        rows = rows[dates[rows] <= np.datetime64(pd.Timestamp(end))]
+    rows = rows[np.argsort(dates[rows], kind='stable')]
+    return _metrics_table(data.iloc[rows], data.iloc[rows - 1])
+
+def _layout(header, paragraphs, fmt):
+    if fmt == 'html':
+        return ('<h3>' + html.escape(header) + '</h3>\n'
+                + ''.join('<p>' + html.escape(paragraph) + '</p>\n' for paragraph in paragraphs) + '<br>\n')
+    if fmt == 'markdown':
+        return '### ' + header + '\n\n' + '\n\n'.join(paragraphs) + '\n\n\n'
+    return '\n\n'.join([header] + paragraphs) + '\n\n\n'
+
+def render_rows(table, fmt='text'):
+    '''
+    Narrative of every row of a county_metrics or daily_metrics table, as a list of
+    (county, today_date, msg) in table order. The sentence variants are picked and
+    the numbers formatted per column, then each row is one pass over the fixed
+    templates.
+    '''
+    if fmt not in FORMATS:
+        raise ValueError('Unknown narrative format ' + fmt)
+    difference = (table['today'] - table['yesterday']).to_numpy()
+    fields = {
+        'county': table.index,
+        'today': table['today'],
+        'yesterday': table['yesterday'],
+        'today_date': table['mydate'].dt.strftime('%A, %b %d, %Y'),
+        'difference': np.abs(difference),
+        'direction': np.where(difference < 0, 'a decrease', 'an increase'),
+        'arrow': np.select([difference < 0, difference == 0], ['\u2193', '\u2194'], '\u2191'),
+        'active': np.where(difference == 0, ACTIVE_EQUAL, ACTIVE_CHANGED),
+        'deaths': np.where(table['new_deaths_today'] <= 0, NO_NEW_DEATHS, NEW_DEATHS),
+        'new_cases_today': table['new_cases_today'],
+        'new_recoveries_today': table['new_recoveries_today'],
+        'new_deaths_today': table['new_deaths_today'],
+        'preliminary_cfr': table['cfr'].map('{:.2%}'.format),
+        'pp_average': table['pp14'].map('{:.2%}'.format),
+    }
+    rows = [dict(zip(fields, values)) for values in zip(*(list(column) for column in fields.values()))]
+
+    rendered = []
+    for row in rows:
+        header = row['arrow'] + ' ' + row['county'].upper() + ' COUNTY ' + row['arrow']
+        paragraphs = [template.format_map(row) for template in
+                      (row['active'], NEW_INFO, row['deaths'], PCFR, POSITIVITY)]
+        rendered.append((row['county'], row['today_date'], _layout(header, paragraphs, fmt)))
+    return rendered
+
+def render_narratives(table, fmt='text'):
+    '''
+    Narratives of a county_metrics table as {county: (msg, today_date)}.
+    '''
+    return {county: (msg, today_date) for county, today_date, msg in render_rows(table, fmt)}
+
+def build_county_narrative(county_data, county, fmt='text'):
+    '''
+    Narrative for the newest row of one county's master file rows compared with the
+    previous day. Has no side effects so it can run in worker processes.
+    Returns (msg, today_date).
+    '''
+    table = county_metrics(county_data)
+    if table.empty:
+        raise IndexError('Less than two days of data for ' + str(county) + ' County')
+    table.index = [str(county)]
+    return render_narratives(table, fmt)[str(county)]
+
+def paragraph(text, fmt='text'):
+    '''
+    Free text (Rt, explanations, sources) in the given narrative format.
+    '''
+    if fmt == 'html':
+        return '<p>' + html.escape(text.strip()).replace('\n', '<br>\n') + '</p>\n'
+    return text
+
+def build_nyt_county_narrative(county_data, county, state):
+    '''
+    Reduced narrative for counties only covered by the NYT data (cases and deaths,
+    no testing or recovery numbers).
+    Returns (msg, today_date).
+    '''
+    county_data = county_data.sort_values(by=['date'], ascending=False)
+    row1 = county_data.iloc[0]
+    row2 = county_data.iloc[1]
+
+    today_date = row1['date'].strftime('%A, %b %d, %Y')
+    new_cases_today = int(row1['New_Cases_Today'])
+    new_cases_yesterday = int(row2['New_Cases_Today'])
+    total_cases = int(row1['cases'])
+    new_deaths_today = int(row1['New_Deaths_Today'])
+    total_deaths = int(row1['deaths'])
+    preliminary_cfr = "{:.2%}".format(float(total_deaths/total_cases))
+
+    arrow = '\u2194'
+    if new_cases_today > new_cases_yesterday:
+        arrow = '\u2191'
+    elif new_cases_today < new_cases_yesterday:
+        arrow = '\u2193'
+
+    header_msg = arrow + ' ' + str(county).upper() + ' COUNTY, ' + str(state).upper() + ' ' + arrow
+
+    new_info_msg = u"{new_cases_today} new cases were reported in {county} County on {today_date}, for a total of {total_cases}.".format(new_cases_today = new_cases_today, county = county, today_date = today_date, total_cases = total_cases)
+
+    new_deaths_msg = u"Sadly, {new_deaths_today} more of our {county} County friends and neighbors have died due to COVID-19.".format(new_deaths_today = new_deaths_today, county = county)
+    if new_deaths_today <= 0:
+        new_deaths_msg = u"Fortunately, we have not lost any additional {county} County friends and neighbors to the virus.".format(county = county)
+
+    pcfr_msg = u"The preliminary case fatality ratio in the County is currently {preliminary_cfr}\n\n\n".format(preliminary_cfr = preliminary_cfr)
+
+    msg = "\n\n".join([header_msg, new_info_msg, new_deaths_msg, pcfr_msg])
+    return msg, today_date
+
+def generate_positivity_explanation():
+    return u'\u204d (The WHO recommends that rates of positivity in testing should remain at 5% or lower for at least 14 days before loosening restrictions.)\n\n'
+
+def generate_cfr_explanation():
+    return u'\u204d (The case fatality ratio is the proportion of deaths from a certain disease compared to the total number of people diagnosed with the disease for a particular period. A CFR is conventionally expressed as a percentage and represents a measure of disease severity. A CFR can only be considered final when all the cases have been resolved [either died or recovered]. The preliminary CFR, for example, during an outbreak with a high daily increase and long resolution time would be substantially lower than the final CFR.)\n\n'
+
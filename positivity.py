@@ -0,0 +1,39 @@
+import pandas as pd
+
+PERIODS = (14,)
+
+
+def calculate_positivity_rate(data, county, period):
+    '''
+    Per-county rolling positivity, kept as the reference for the vectorized
+    calculate_positivity_rates (see benchmarks/bench_positivity.py).
+    '''
+    county_data = data[data['county_nam'] == county]
+    datetime_series = pd.to_datetime(county_data['mydate'])
+    datetime_index = pd.DatetimeIndex(datetime_series.values)
+    df2 = county_data.set_index(datetime_index)
+    df2 = df2.sort_index()
+    df2['pp'] = df2['positive'] / df2['total_tests']
+    df2['14d_pp'] = df2['pp'].rolling(window=period, min_periods=1, center=False).mean()
+    return df2.sort_index(ascending=False)
+
+
+def calculate_positivity_rates(data, periods=PERIODS, history=None):
+    '''
+    Add the daily pp and a rolling <n>d_pp column per period to data, for all
+    counties in one grouped pass. When history (already carrying those columns) is
+    given, its last days per county seed the rolling windows so that only the rows
+    in data have to be computed.
+    '''
+    keys = ['county_nam', 'mydate']
+    data['pp'] = data['positive'] / data['total_tests']
+    tail = data.iloc[0:0]
+    if history is not None:
+        tail = history.groupby('county_nam', observed=True).tail(max(periods) - 1)
+    frame = pd.concat([tail[keys + ['pp']], data[keys + ['pp']]], ignore_index=True)
+    frame = frame.sort_values(by=keys)
+    grouped = frame.groupby('county_nam', observed=True, sort=False)['pp']
+    for period in periods:
+        rolled = grouped.rolling(window=period, min_periods=1).mean().reset_index(level=0, drop=True)
+        data[str(period) + 'd_pp'] = rolled.sort_index().iloc[len(tail):].values
+    return data
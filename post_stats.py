@@ -2,69 +2,49 @@ import json
 import logging
 import yaml
 import pandas as pd
-import numpy as np
-import seaborn
-import matplotlib.pyplot as plt
-import plotly.graph_objects as go
-import plotly.express as px
-from plotly.subplots import make_subplots
-import io
-import requests
-from facebook import GraphAPI
+import os
+import fetch_cache
+import fips_store
+import master_store
+import metrics
+import positivity
+import narrative
+import boundaries
+import correlation
+import regions
+import render
+import publisher
+import rt
+import run_state
 from datetime import datetime
-import smtplib
-from email.mime.text import MIMEText
 
-with open("./config.yaml", 'r') as ymlfile:
-    cfg = yaml.load(ymlfile, Loader=yaml.FullLoader)
+# plotting libraries are only imported (via figures) when a report renders figures
 
-if str(cfg['logging']) == 'console':
-    logging.basicConfig(format='%(levelname)s:%(asctime)s %(message)s', level=logging.DEBUG)
+def load_config(path='./config.yaml'):
+    with open(path, 'r') as ymlfile:
+        return yaml.load(ymlfile, Loader=yaml.FullLoader)
 
-logFormatter = logging.Formatter("%(asctime)s [%(threadName)-12.12s] [%(levelname)-5.5s]  %(message)s")
-rootLogger = logging.getLogger()
-
-fileHandler = logging.FileHandler("{0}/{1}.log".format('./', 'post_stats'))
-fileHandler.setFormatter(logFormatter)
-rootLogger.addHandler(fileHandler)
-
-consoleHandler = logging.StreamHandler()
-consoleHandler.setFormatter(logFormatter)
-rootLogger.addHandler(consoleHandler)
-
-now = datetime.now()
-
-test_mode = cfg['test_mode']
-post = cfg['post_to_facebook']
-email = cfg['send_email']
-group = cfg['test_group_uid']
-if not test_mode:
-    group = cfg['group_uid']
-
-urls = cfg['urls']
-master_url = urls['ar_covid']
-rt_url = urls['rt']
-
-who_t = float(cfg['who_threshold'])
-
-gen_bullet = cfg['generate_bullet']
-gen_line = cfg['generate_line']
-gen_graph = cfg['generate_xkcd_graph']
-gen_state_map = cfg['generate_state_map']
-gen_regional_map = cfg['generate_regional_map']
-gen_cases_graph = cfg['generate_cases_graph']
-
-gen_matrix = cfg['generate_matrix']
+def configure_logging(cfg, log_dir='./', name='post_stats'):
+    '''
+    Install the console and file handler (<log_dir>/<name>.log) once, no matter
+    how often it is called.
+    '''
+    rootLogger = logging.getLogger()
+    if getattr(rootLogger, '_post_stats_configured', False):
+        return
+    rootLogger._post_stats_configured = True
 
-latest_index = cfg['ar_covid_latest_index']
-new_data = False
-post_negative_results = cfg['post_negative_results']
+    logFormatter = logging.Formatter("%(asctime)s [%(threadName)-12.12s] [%(levelname)-5.5s]  %(message)s")
+    rootLogger.setLevel(cfg.get('level', 'DEBUG'))
 
-counties = cfg['counties']
-p_county = cfg['primary_county']
+    fileHandler = logging.FileHandler("{0}/{1}.log".format(log_dir, name))
+    fileHandler.setFormatter(logFormatter)
+    rootLogger.addHandler(fileHandler)
 
-c = requests.get(urls['county_geojson'])
-county_boundaries = c.json()
+    if str(cfg['logging']) == 'console':
+        consoleHandler = logging.StreamHandler()
+        consoleHandler.setFormatter(logFormatter)
+        rootLogger.addHandler(consoleHandler)
 
 def read_creds(filename):
     '''
@@ -75,485 +55,605 @@ def read_creds(filename):
         credentials = json.load(f)
     return credentials
 
-def read_data(url, index):
-    logging.debug('Getting data from ' + url)
-    s = requests.get(url).content
-    c = pd.read_csv(io.StringIO(s.decode('utf-8')), index_col=index, dtype={"fips": str})
-
-    return c
-
-def generate_line(df):
-    df = df[df['mydate'] > '2020-09-12']
-    fig = px.line(df, x='mydate', y='14d_pp',
-              color="county_nam",
-              line_group="county_nam",
-              hover_name="county_nam",
-              labels={
-                  "14d_pp": "Positivity Rate",
-                  "mydate": "Date"
-                  })
-    fig.update_traces(line=dict(width=4))
-
-    fig.add_shape(type='line',
-                x0=0,
-                y0=who_t,
-                x1=1,
-                y1=who_t,
-                line=dict(color='Red',dash="dot", width=4),
-                xref='paper',
-                yref='y')
-
-    fig.add_annotation(text="WHO Recommended Threshold",
-                  xref="paper", yref="y",
-                  x=1, y=who_t + .002, showarrow=False,
-                  font=dict(color="red",size=10)
-                  )
-
-    fig.update_layout(title='14 Day Average Test Positivity Rate Over Time',
-                      showlegend=True,
-                      legend_title_text='County',
-                      yaxis_tickformat = '.2%',
-                      font=dict(size=16))
-    fig.show()
-
-def generate_bullet(df):
-    fig = go.Figure()
-
-    y1 = 0.1
-    y2 = 0.2
-    row_date = None
-    axis_visible = True
-    for county in counties:
-        county_data = df[df['county_nam'] == county]
-        row1 = county_data.iloc[0]
-        row_date = row1['mydate'].strftime('%A, %b %d, %Y')
-        pp_last_fourteen_days = row1['14d_pp']
-        fig.add_trace(go.Indicator(
-            mode = "number+gauge+delta", value = pp_last_fourteen_days,
-            delta = {'reference': who_t},
-            domain = {'x': [0.1, 1], 'y': [y1, y2]},
-            title = {'text': str(county) + " County"},
-            gauge = {
-                'shape': "bullet",
-                'axis': {'range': [None, .2], 'visible': axis_visible},
-                'threshold': {
-                    'line': {'color': "red", 'width': 2},
-                    'thickness': 1,
-                    'value': who_t},
-                'bar': {'color': "black"},
-                'bgcolor': 'LightGrey'}))
-        y1 += 0.12
-        y2 += 0.12
-        axis_visible = False
-
-    fig.update_traces(number_valueformat='.2%', selector=dict(type='indicator'))
-    fig.update_traces(gauge_axis_tickformat='.2%', selector=dict(type='indicator'))
-    fig.update_traces(delta_valueformat='.2%', selector=dict(type='indicator'))
-    fig.update_traces(delta_increasing_color='#FF0000', selector=dict(type='indicator'))
-    fig.update_traces(delta_decreasing_color='#00FF00', selector=dict(type='indicator'))
-    fig.update_yaxes(automargin=True)
-
-    fig.add_annotation(x=-1, y=4,
-            text="Text annotation without arrow",
-            showarrow=False,
-            yshift=10)
-
-    fig.update_layout(
-        title={
-            'text': "14 Day Test Positivity Rate (" + row_date + ")",
-            'y':y1,
-            'x':0.5,
-            'xanchor': 'center',
-            'yanchor': 'top'},
-        autosize=True,
-        width=1300,
-        height=729
-    )
-
-
-    fig.show()
-
-def generate_xkcd_graph(df):
-    with plt.xkcd():
-        ax = df.plot(x ='mydate', y='active_cases', kind = 'line', grid = True, title = 'active covid 19 cases in union county over time', legend = False, figsize = [16, 9])
-        ax.set_xlabel("date")
-        ax.set_ylabel("active cases")
-        ax.grid(True, linewidth=1)
-
-        line_annotation1 = datetime(2020, 9, 13)
-        line_annotation2 = datetime(2020, 11, 7)
-        line_annotation3 = datetime(2020, 10, 13)
-        ax.annotate('', xy=(line_annotation1, 90), xytext=(line_annotation2, 90), xycoords='data', textcoords='data', arrowprops={'arrowstyle': '|-|'})
-        ax.annotate('period of calm and preparation', xy=(line_annotation3, 98), ha='center', va='center')
-
-        # Annotate
-        x_line_annotation = datetime(2020, 11, 26)
-
-        ax.annotate('violent ritual involving maskless\nfamily gatherings and gorging on the \ncorpse of a turkey',
-                    xy=(x_line_annotation, 117),
-                    xycoords='data',
-                    xytext=(-50,-75),
-                    textcoords='offset points',
-                    arrowprops=dict(headwidth=5, width=2, color='#363d46', connectionstyle="angle3,angleA=0,angleB=-90"),
-                    fontsize=12)
-        # Annotate
-        x_line_annotation = datetime(2021, 1, 2)
-
-        ax.annotate('SURPRISE!\na 190% increase since\nmurdering the turkey',
-                    xy=(x_line_annotation, 365),
-                    xycoords='data',
-                    xytext=(-180,-35),
-                    textcoords='offset points',
-                    arrowprops=dict(headwidth=5, width=2, color='#363d46', connectionstyle="angle3,angleA=0,angleB=-90"),
-                    fontsize=12)
-
-        # Annotate
-        x_line_annotation = datetime(2020, 11, 14)
-
-        ax.annotate('warriors begin gathering at rustic shelters\nin groups to plot the mass murder of beasts\nwith white tails',
-                    xy=(x_line_annotation, 75),
-                    xycoords='data',
-                    xytext=(-40,-90),
-                    textcoords='offset points',
-                    arrowprops=dict(headwidth=5, width=2, color='#363d46', connectionstyle="angle3,angleA=0,angleB=-90"),
-                    fontsize=12)
-
-        # Annotate
-        x_line_annotation = datetime(2020, 12, 25)
-
-        ax.annotate('second, morbid ritual revolving around\nhanging ornaments and lights on the\ncorpse of a tree',
-                    xy=(x_line_annotation, 280),
-                    xycoords='data',
-                    xytext=(-290,-65),
-                    textcoords='offset points',
-                    arrowprops=dict(headwidth=5, width=2, color='#363d46', connectionstyle="angle3,angleA=0,angleB=90"),
-                    fontsize=12)
-
-        plt.gca().spines['top'].set_visible(False)
-        plt.gca().spines['right'].set_visible(False)
-        plt.show()
-
-def generate_state_cloropleth(latest_data, county_boundaries, min_cases, max_cases):
-    fig = px.choropleth_mapbox(latest_data, geojson=county_boundaries, color='Active_Cases_10k_Pop',
-        locations='fips',
-        color_continuous_scale="portland",
-        range_color=[min_cases, max_cases],
-        mapbox_style='open-street-map',
-        center={'lat': 34.8938, 'lon': -92.4426},
-        zoom=6.8,
-        opacity=0.6,
-        title='Active Cases per 10k of Population (' + max_date.strftime('%A, %b %d, %Y') + ')',
-        hover_name='county_nam',
-        labels={'Active_Cases_10k_Pop': 'Active Cases/10k Population'})
-    fig.update_layout(margin={"r":10,"t":40,"l":10,"b":10})
-    fig.show()
-
-def generate_active_cases_graph(data, counties):
-    data = data[(data['mydate'] > '2020-09-13')]
-    filtered_data = data[data['county_nam'].isin(counties)]
-    grouped_df = filtered_data.groupby(['mydate']).agg(
-        {
-             'active_cases':sum,
-             'pp': "mean"
-        }
-    ).reset_index()
-
-    county_text = u', '.join(counties)
-
-    max_index = grouped_df.index.max()
-    max_date = max(grouped_df['mydate'])
-    last_pp = grouped_df.loc[max_index]['pp']
-    last_active = grouped_df.loc[max_index]['active_cases']
-
-    low_pp = min(grouped_df['pp'])
-    low_pp_index = grouped_df['pp'].idxmin()
-    low_pp_date = grouped_df.loc[low_pp_index]['mydate']
-
-    max_active = max(grouped_df['active_cases'])
-    max_active_index = grouped_df['active_cases'].idxmax()
-    max_active_date = grouped_df.loc[max_active_index]['mydate']
-
-
-    grouped_df['county_nam'] = 'All Counties'
-    grouped_df = grouped_df.sort_values(by=['mydate'], ascending=False)
-
-    # Create figure with secondary y-axis
-    fig = make_subplots(specs=[[{"secondary_y": True}]])
-    # Add traces
-    fig.add_trace(
-        go.Bar(
-            x=grouped_df['mydate'],
-            y=grouped_df['active_cases'],
-            name="Active Cases",
-            marker=dict(color='rgba(100, 149, 237, .8)')),
-        secondary_y=False)
-
-    fig.add_trace(
-        go.Scatter(x=grouped_df['mydate'],
-                   y=grouped_df['pp'],
-                   name="Test Positivity",
-                   mode = 'lines',
-                   line=dict(shape='linear', color='rgba(237, 188, 100, 1)', width=4)),
-        secondary_y=True)
-
-    fig.update_xaxes(title_text="Date")
-    fig.update_yaxes(title_text="Active Cases", secondary_y=False)
-    fig.update_yaxes(title_text="Test Positivity Rate", secondary_y=True)
-
-    fig.update_layout(title='Active Cases, Test Positivity Rate, Six County Region <br>' + county_text,
-                      showlegend=True,
-                      yaxis2_tickformat = '.2%',
-                      font=dict(size=16))
-
-    fig.add_annotation(x=max_date, y=last_pp, text="{:.2%}".format(last_pp), xanchor='auto', xref="x", yref="y2", bgcolor='rgba(232, 168, 54, 1)', font=dict(color='Black'))
-    fig.add_annotation(x=low_pp_date, y=low_pp, text="Low Positivity Rate: " + "{:.2%}".format(low_pp), xanchor='auto', xref="x", yref="y2", bgcolor='rgba(232, 168, 54, 1)', font=dict(color='Black'))
-    fig.add_annotation(x=max_date, y=last_active, text=str(last_active), xanchor='auto', xref="x", yref="y", bgcolor='rgba(54, 118, 232, 1)', font=dict(color='Ivory'))
-    fig.add_annotation(x=max_active_date, y=max_active, text='Max Active Cases: ' + str(max_active), xanchor='auto', xref="x", yref="y", bgcolor='rgba(54, 118, 232, 1)', font=dict(color='Ivory'))
-    fig.show()
-
-def calculate_positivity_rate(data, county, period):
-    county_data = data[data['county_nam'] == county]
-    datetime_series = pd.to_datetime(county_data['mydate'])
-    datetime_index = pd.DatetimeIndex(datetime_series.values)
-    df2 = county_data.set_index(datetime_index)
-    df2 = df2.sort_index()
-    df2['pp'] = df2['positive'] / df2['total_tests']
-    df2['14d_pp'] = df2['pp'].rolling(window=period, min_periods=1, center=False).mean()
-    return df2.sort_index(ascending=False)
-
 def group_counties(data, county1, county2):
     combo = str(county1 + ' + ' + county2)
     filtered_data = data[data['county_nam'].isin([county1, county2])]
-    grouped_df = filtered_data.groupby(['mydate']).mean()
+    grouped_df = filtered_data.groupby(['mydate']).mean(numeric_only=True)
     grouped_df['combo'] = combo
     grouped_df = grouped_df.sort_values(by=['mydate'], ascending=False)
     return grouped_df
 
 def group_all_counties(data, counties):
     filtered_data = data[data['county_nam'].isin(counties)]
-    grouped_df = filtered_data.groupby(['mydate']).mean().reset_index()
+    grouped_df = filtered_data.groupby(['mydate']).mean(numeric_only=True).reset_index()
     grouped_df['county_nam'] = 'All Counties'
     grouped_df = grouped_df.sort_values(by=['mydate'], ascending=False)
     return grouped_df
 
-def generate_county_narrative(data, county):
-    county_data = data[data['county_nam'] == county]
-    county_data.sort_values(by=['mydate'], inplace=True, ascending=False)
-    if county == p_county and gen_graph:
-        generate_xkcd_graph(county_data[(county_data['mydate'] > '2020-09-10')])
-    county_data['mydate'] = county_data['mydate'].dt.strftime('%A, %b %d, %Y')
-
-    row1 = county_data.iloc[0]
-    row2 = county_data.iloc[1]
-
-    if row1['mydate'] != latest_index:
-        logging.info("New Arkansas COVID data found for " + county + " County")
-        with open(r'./config_old.yaml', 'w') as file:
-            configuration = yaml.dump(cfg, file)
-    else:
-        logging.info("No new Arkansas COVID data found for " + county + " County")
-        return None
-
-    today = int(row1['active_cases'])
-    yesterday = int(row2['active_cases'])
-    today_date = row1['mydate']
-    new_cases_today = int(row1['New_Cases_Today'])
-    total_cases = int(row1['positive'])
-    new_recoveries_today = int(row1['Recovered_Since_Yesterday'])
-    new_deaths_today = int(row1['New_Deaths_Today'])
-    total_deaths = int(row1['deaths'])
-    preliminary_cfr = "{:.2%}".format(float(total_deaths/total_cases))
-    pp_last_fourteen_days = row1['14d_pp']
-    pp_average = ("{:.2%}".format(pp_last_fourteen_days))
-
-    difference = today - yesterday
-    direction = 'an increase'
-    arrow = '\u2191'
-
-    if difference < 0:
-        direction = 'a decrease'
-        difference = abs(difference)
-        arrow = '\u2193'
-    elif difference == 0:
-        arrow = '\u2194'
-
-    header_msg = arrow + ' ' + str(county).upper() + ' COUNTY ' + arrow
-
-    active_cases_msg = u"There were {today} active cases in {county} County on {today_date}. This is {direction} of {difference} from the previous day's total of {yesterday}.".format(today = today, county = county, yesterday = yesterday, difference = difference, direction = direction, today_date = today_date)
-    if difference == 0:
-        active_cases_msg = u"There were {today} active cases in {county} County on {today_date}. This is equal to the previous day's total.".format(today = today, county = county, today_date = today_date)
-
-    new_info_msg = u"{new_cases_today} new cases were added and {new_recoveries_today} cases are considered newly recovered.".format(new_cases_today=new_cases_today, new_recoveries_today=new_recoveries_today)
-
-    new_deaths_msg = u"Sadly, {new_deaths_today} more of our {county} County friends and neighbors have died due to COVID-19.".format(new_deaths_today = new_deaths_today, county = county)
-    if new_deaths_today <= 0:
-        new_deaths_msg = u"Fortunately, we have not lost any additional {county} County friends and neighbors to the virus.".format(county = county)
-
-    pcfr_msg = u"The preliminary case fatality ratio in the County is currently {preliminary_cfr}".format(preliminary_cfr = preliminary_cfr)
-
-    pp_message = "{pp_average} of tests in the County were positive over the last 14 days.\n\n\n".format(pp_average = pp_average)
-
-    msg = "\n\n".join([header_msg, active_cases_msg, new_info_msg, new_deaths_msg, pcfr_msg, pp_message])
-
-    cfg.update({'ar_covid_latest_index': row1['mydate']})
-
-    with open(r'./config.yaml', 'w') as file:
-        configuration = yaml.dump(cfg, file)
-
-    return msg
-
-def generate_positivity_explanation():
-    return u'\u204d (The WHO recommends that rates of positivity in testing should remain at 5% or lower for at least 14 days before loosening restrictions.)\n\n'
-
-def generate_cfr_explanation():
-    return u'\u204d (The case fatality ratio is the proportion of deaths from a certain disease compared to the total number of people diagnosed with the disease for a particular period. A CFR is conventionally expressed as a percentage and represents a measure of disease severity. A CFR can only be considered final when all the cases have been resolved [either died or recovered]. The preliminary CFR, for example, during an outbreak with a high daily increase and long resolution time would be substantially lower than the final CFR.)\n\n'
-
-def generate_rt_narrative():
+def generate_rt_narrative(rt_index, regions=rt.REGIONS, date=None):
+    '''
+    The latest Rt of every region, e.g. {'AR': 'Arkansas', 'LA': 'Louisiana'}, or
+    the latest one on or before date.
+    '''
     rt_msg = ""
-    rt_data = read_data(rt_url, 2)
-    rt_data['date'] = pd.to_datetime(rt_data['date'])
+    for region, name in regions.items():
+        try:
+            latest_rt_row = rt_index.latest(region) if date is None else rt_index.at(region, date)
+        except KeyError:
+            logging.warning('No Rt data for ' + region)
+            continue
+        rt_mean = "{:.3}".format(float(latest_rt_row['mean']))
+        rt_date = latest_rt_row['date'].strftime('%A, %b %d, %Y')
+        rt_msg = rt_msg + u"The effective reproduction rate (R\u209c) in {name} on {rt_date} was {rt_mean}.\n\n".format(name=name, rt_date=rt_date, rt_mean=rt_mean)
+
+    rt_msg = rt_msg + u"(Values over 1.0 mean we should expect more cases in the State, values under 1.0 mean we should expect fewer.)\n\n\n"
+    return rt_msg
 
-    uc_rt_data = rt_data[rt_data['region'] == 'AR']
-    uc_rt_data.sort_values(by=['date'], inplace=True, ascending=False)
-    uc_rt_data['date'] = uc_rt_data['date'].dt.strftime('%A, %b %d, %Y')
+def assemble_summary(county_text, date_text, county_msgs, rt_msg, fmt='text'):
+    '''
+    The full summary around the already rendered county narratives.
+    '''
+    parts = [narrative.paragraph(u"Statistics Summary for " + county_text + " Counties (" + date_text + ')\n\n', fmt)]
+    parts.extend(county_msgs)
+    parts.append(narrative.paragraph(rt_msg, fmt))
+    parts.append(narrative.paragraph(narrative.generate_positivity_explanation(), fmt))
+    parts.append(narrative.paragraph(narrative.generate_cfr_explanation(), fmt))
+    parts.append(narrative.paragraph(u"Sources:\n - https://arkansascovid.com/\n - https://rt.live/", fmt))
+    return ''.join(parts)
+
+class SharedData:
+    '''
+    What every report of a run reads: the master frame and its county row ranges,
+    the Rt index, the regional aggregates and the correlations. Reports built on
+    one SharedData fetch, parse and aggregate these once between them.
+    '''
 
-    latest_rt_row = uc_rt_data.iloc[0]
-    rt_mean = "{:.3}".format(float(latest_rt_row['mean']))
-    rt_date = latest_rt_row['date']
+    def __init__(self, cfg):
+        self.urls = cfg['urls']
+        self.cache_dir = cfg.get('cache_dir', fetch_cache.CACHE_DIR)
+        self.master_path = cfg.get('master_store', master_store.STORE_PATH)
+        self.positivity_periods = cfg.get('positivity_periods', positivity.PERIODS)
+        self.regions_path = cfg.get('regions_store', regions.REGIONS_PATH)
+        self.rt_path = cfg.get('rt_store', rt.RT_PATH)
+        self.correlation_cfg = cfg.get('correlation', {})
+        self.fips_path = cfg.get('fips_store', fips_store.FIPS_PATH)
+        self.url_timeouts = {self.urls[name]: seconds for name, seconds in cfg.get('timeouts', {}).items()}
+
+        self.data = None
+        self.slices = None
+        self.stale = True
+        self.rt_index = None
+        self.aggregates = None
+        self.definitions = {}
+        self.correlations = None
+        self.fips_index = None
+        # results that are up to date with the last refresh
+        self.current = set()
+
+    def timeout(self, url):
+        return self.url_timeouts.get(url, fetch_cache.TIMEOUT)
+
+    def refresh(self, urls):
+        '''
+        Download urls and bring the master store up to date. Returns the newest data
+        date, read from the store without loading the frame when it changed.
+        '''
+        # download all sources at once; the fetches below are then served from memory
+        fetch_cache.prefetch(urls, self.cache_dir, self.url_timeouts)
+        appended = master_store.update_store(self.urls['ar_covid'], self.master_path, self.cache_dir, self.positivity_periods)
+        self.stale = self.stale or self.data is None or appended
+        self.current.discard('rt')
+        return self.latest_date()
+
+    def latest_date(self):
+        if self.stale:
+            return master_store.latest_date(self.master_path)
+        return self.data['mydate'].max()
+
+    def read(self):
+        '''
+        Load the master frame unless the one loaded by an earlier call is current.
+        '''
+        if self.stale:
+            self.data = master_store.read_store(self.master_path)
+            # the store is sorted by county and date, so each county is a row range of it
+            self.slices = master_store.county_slices(self.data)
+            self.stale = False
+            self.current -= {'aggregates', 'correlations'}
+            if self.fips_path:
+                # the Arkansas side of the (fips, date) store shared with the NYT data
+                self.fips_index = fips_store.update_source('ar', self.data, self.fips_path)
+            logging.debug('Master frame loaded, ' + str(self.data.memory_usage(deep=True).sum() // 1024) + ' KB')
+        return self.data
+
+    def register_regions(self, definitions):
+        '''
+        Add regions to those aggregated. All registered regions are kept in one
+        store, so reports asking for different regions do not rebuild it in turn.
+        '''
+        definitions = {name: sorted(members) for name, members in definitions.items()}
+        changed = [name for name, members in definitions.items() if self.definitions.get(name) != members]
+        if changed:
+            redefined = [name for name in changed if name in self.definitions]
+            if redefined:
+                logging.warning('Regions ' + ', '.join(redefined) + ' are defined differently by two reports and are rebuilt on every run')
+            self.definitions.update(definitions)
+            self.current.discard('aggregates')
+
+    def update_regions(self, definitions):
+        '''
+        Regional aggregates covering definitions, computed once per frame.
+        '''
+        self.register_regions(definitions)
+        if 'aggregates' not in self.current:
+            self.aggregates = regions.update_regions(self.data, self.definitions, self.regions_path)
+            self.current.add('aggregates')
+        return self.aggregates
+
+    def update_rt(self):
+        if 'rt' not in self.current:
+            url = self.urls['rt']
+            self.rt_index = rt.update_rt(self.rt_index, url, self.rt_path, self.cache_dir, self.timeout(url))
+            self.current.add('rt')
+        return self.rt_index
+
+    def correlate(self):
+        '''
+        Rolling and lagged correlations between all counties, written to disk for analysis.
+        '''
+        if 'correlations' not in self.current:
+            with metrics.stage('correlation'):
+                self.correlations = correlation.compute(self.data, self.correlation_cfg)
+            self.current.add('correlations')
+        return self.correlations
+
+class Report:
+    '''
+    One configured daily report, split into the stages load, compute, narrate,
+    render and publish. A long running worker can keep a Report between runs;
+    nothing is read, fetched or plotted until a stage asks for it. Reports of
+    several profiles share the data they are computed from through `shared`.
+    '''
 
-    rt_msg = u"The effective reproduction rate (R\u209c) in the State on {rt_date} was {rt_mean}. (Values over 1.0 mean we should expect more cases in the State, values under 1.0 mean we should expect fewer.)\n\n\n".format(rt_date=rt_date, rt_mean=rt_mean)
-    return rt_msg
+    def __init__(self, cfg, shared=None):
+        self.cfg = cfg
+        self.shared = shared or SharedData(cfg)
+        self.name = cfg.get('name')
+
+        self.test_mode = cfg['test_mode']
+        self.post = cfg['post_to_facebook']
+        self.email = cfg['send_email']
+        publish_cfg = cfg.get('publish', {})
+        self.groups = [cfg['test_group_uid']]
+        if not self.test_mode:
+            self.groups = [cfg['group_uid']] + list(publish_cfg.get('groups', []))
+        self.recipients = publish_cfg.get('recipients', [])
+
+        self.urls = cfg['urls']
+        self.master_url = self.urls['ar_covid']
+        self.rt_url = self.urls['rt']
+
+        self.who_t = float(cfg['who_threshold'])
+
+        self.gen_bullet = cfg['generate_bullet']
+        self.gen_line = cfg['generate_line']
+        self.gen_graph = cfg['generate_xkcd_graph']
+        self.gen_state_map = cfg['generate_state_map']
+        self.gen_regional_map = cfg['generate_regional_map']
+        self.gen_cases_graph = cfg['generate_cases_graph']
+        self.gen_matrix = cfg['generate_matrix']
+
+        self.post_negative_results = cfg['post_negative_results']
+
+        self.counties = cfg['counties']
+        self.p_county = cfg['primary_county']
+
+        self.cache_dir = cfg.get('cache_dir', fetch_cache.CACHE_DIR)
+        self.state_path = cfg.get('state_file', run_state.STATE_PATH)
+        self.rt_regions = cfg.get('rt_regions', rt.REGIONS)
+        # profiles report different counties, so each has its own all counties region
+        self.all_counties = regions.ALL_COUNTIES if self.name is None else self.name + ': ' + regions.ALL_COUNTIES
+        self.regions = regions.default_regions(self.counties, self.p_county, self.all_counties)
+        self.regions.update(cfg.get('regions', {}))
+
+        self.now = datetime.now()
+        self.new_data = False
+        self.data_date = None
+        self.state = run_state.load_state(self.state_path)
+        self.full_data = None
+        self.county_table = None
+        self.rt_msg = None
+        self.grouped_data = None
+        self.aggregates = None
+        self.correlations = None
+        self.renderer = None
+        self.publisher = None
+        self.published = False
+
+    @property
+    def latest_index(self):
+        # the config value only seeds the state of installs that predate the state file
+        return self.state.get('ar_covid_latest_index', self.cfg.get('ar_covid_latest_index'))
+
+    @property
+    def data(self):
+        return self.shared.data
+
+    @property
+    def slices(self):
+        return self.shared.slices
+
+    @property
+    def rt_index(self):
+        return self.shared.rt_index
+
+    def timeout(self, url):
+        return self.shared.timeout(url)
+
+    def prefetch_urls(self):
+        # the county GeoJSON is only fetched when a map is rebuilt, see map_boundaries
+        return [self.master_url, self.rt_url]
+
+    def load(self, refresh=True):
+        '''
+        Refresh the master store. Returns False when there is nothing new to report,
+        without loading the frame. A frame loaded by an earlier call is kept and only
+        re-read when rows were appended to the store. With refresh=False the shared
+        data was already refreshed for this run, by the first of several profiles.
+        '''
+        self.now = datetime.now()
+        self.new_data = False
+        self.data_date = None
+        self.state = run_state.load_state(self.state_path)
+        self.rt_msg = None
+
+        if refresh:
+            latest = self.shared.refresh(self.prefetch_urls())
+        else:
+            latest = self.shared.latest_date()
+
+        # cheap freshness check before loading and grouping anything
+        if latest.strftime('%A, %b %d, %Y') == self.latest_index and not self.post_negative_results:
+            logging.info('No new Arkansas COVID data since ' + self.latest_index)
+            return False
+
+        self.shared.read()
+        return True
+
+    def compute(self):
+        counties = self.counties
+        # the rolling positivity rates (14d_pp and any other positivity_periods) are kept up to date in the store for every county
+        full_data = pd.concat([self.county_data(county) for county in counties if county in self.slices])
+        self.full_data = full_data.set_index(pd.DatetimeIndex(full_data['mydate'].values))
+        # the numbers of every county narrative, for all counties at once
+        self.county_table = narrative.county_metrics(self.full_data)
+
+        # beginnings of grouping to calculate regional statistics and to do analysis on county border interactions;
+        # the pairs and any regions from config.yaml are aggregated incrementally, see regions.py
+        self.aggregates = self.shared.update_regions(self.regions)
+        frames = []
+        for county in counties:
+            if county != self.p_county:
+                combo = self.p_county + ' + ' + county
+                g_df = self.aggregates.means(combo).sort_index(ascending=False)
+                g_df['combo'] = combo
+                frames.append(g_df)
+        self.grouped_data = pd.concat(frames)
+
+        if self.gen_matrix:
+            self.correlations = self.shared.correlate()
+
+    def county_data(self, county):
+        '''
+        Rows of one county, newest first, without copying the master frame.
+        '''
+        return self.data.iloc[self.slices[county]][::-1]
+
+    def narrate(self, fmt='text'):
+        '''
+        Summary of the report counties in one of narrative.FORMATS (text, markdown or
+        html). The county narratives are rendered from the county_metrics table of
+        compute() in one pass.
+        '''
+        now = self.now
+        table = self.county_table
+        new = table[table['mydate'].dt.strftime('%A, %b %d, %Y') != self.latest_index]
+        narratives = narrative.render_narratives(new, fmt)
+
+        county_msgs = []
+        for county in self.counties:
+            if county in narratives:
+                logging.info("New Arkansas COVID data found for " + county + " County")
+                msg, today_date = narratives[county]
+                self.new_data = True
+                # recorded in the state file once the summary is published (see commit())
+                self.data_date = today_date
+            else:
+                logging.info("No new Arkansas COVID data found for " + county + " County")
+                msg = narrative.paragraph("No new data found at " + str(now) + " for " + county + " County\n\n", fmt)
+            county_msgs.append(msg)
+
+        if self.rt_msg is None:
+            self.shared.update_rt()
+            self.rt_msg = generate_rt_narrative(self.rt_index, self.rt_regions)
+
+        summary_msg = assemble_summary(u', '.join(self.counties), now.strftime('%A, %b %d, %Y'), county_msgs, self.rt_msg, fmt)
+        logging.debug(summary_msg)
+        return summary_msg
+
+    def publish(self, summary_msg, delivered=()):
+        '''
+        Deliver the summary to every group and recipient not in delivered, a
+        collection of 'channel:target' strings of an earlier partly failed run.
+        '''
+        if not (self.post or self.email) or not (self.new_data or self.post_negative_results):
+            return []
+
+        if self.publisher is None:
+            credentials = read_creds('./credentials.json')
+            self.publisher = publisher.Publisher(credentials, self.cfg.get('publish', {}))
+
+        deliveries = []
+        groups = [group for group in self.groups if 'facebook:' + str(group) not in delivered]
+        if self.post and groups:
+            deliveries += self.publisher.post_to_groups(groups, summary_msg, 'https://arkansascovid.com/')
+
+        recipients = self.recipients or [self.publisher.credentials['gmail_username']]
+        recipients = [recipient for recipient in recipients if 'email:' + recipient not in delivered]
+        if self.email and recipients:
+            subject = 'COVID-19 Support for Union County and Surrounding Areas, Daily Update for ' + self.now.strftime("%A, %b %d, %Y %k:%M")
+            html = self.narrate('html') if self.cfg.get('publish', {}).get('html_email') else None
+            deliveries += self.publisher.send_email(subject, summary_msg, recipients, html)
+        return deliveries
+
+    def make_renderer(self):
+        render_cfg = self.cfg.get('render', {})
+        return render.Renderer(render_cfg.get('mode', 'show'),
+                               render_cfg.get('output_dir', render.OUTPUT_DIR),
+                               render_cfg.get('formats', render.FORMATS),
+                               render_cfg.get('workers', 1),
+                               render.FigureCache(os.path.join(self.cache_dir, 'figures'),
+                                                  render_cfg.get('cache_mb', 200) * 1024 * 1024))
+
+    def render(self):
+        import figures
+
+        if self.renderer is None:
+            self.renderer = self.make_renderer()
+        renderer = self.renderer
+        full_data = self.full_data
+        data = self.data
+        counties = self.counties
+        who_t = self.who_t
+        cfg = self.cfg
+        # points per trace of the time series figures, all points when unset
+        points = cfg.get('render', {}).get('points')
+
+        # each figure is keyed by the data slice and settings it is drawn from, unchanged ones are reused
+        if self.gen_graph:
+            county_data = full_data[full_data['county_nam'] == self.p_county]
+            xkcd_data = county_data[(county_data['mydate'] > '2020-09-10')].sort_values(by=['mydate'], ascending=False)
+            if not renderer.reuse('xkcd_graph', render.content_hash(xkcd_data[['mydate', 'active_cases']], self.p_county, points)):
+                figures.generate_xkcd_graph(xkcd_data, renderer, points)
+        if self.gen_matrix:
+            figures.generate_correlation_matrix(full_data, renderer)
+        if self.gen_bullet:
+            latest_rows = full_data.groupby('county_nam', observed=True, sort=False).head(1)
+            if not renderer.reuse('bullet', render.content_hash(latest_rows[['county_nam', 'mydate', '14d_pp']], who_t, counties)):
+                figures.generate_bullet(full_data, counties, who_t, renderer)
+        if self.gen_line:
+            line_slice = full_data[full_data['mydate'] > '2020-09-12'][['mydate', 'county_nam', '14d_pp']]
+            if not renderer.reuse('line', render.content_hash(line_slice, who_t, '2020-09-12', points)):
+                figures.generate_line(full_data, who_t, renderer, points)
+
+        if self.gen_state_map or self.gen_regional_map:
+            max_date = data['mydate'].max()
+            latest_data = data[data['mydate'] == max_date]
+
+        if self.gen_state_map:
+            latest_data = latest_data[latest_data['county_nam'] != 'Arkansas_all_counties']
+            min_cases = latest_data['Active_Cases_10k_Pop'].min()
+            max_cases = latest_data['Active_Cases_10k_Pop'].max()
+
+            county_index = self.map_boundaries(renderer, 'state_map', latest_data[['mydate', 'fips', 'county_nam', 'Active_Cases_10k_Pop']])
+            if county_index is not None:
+                figures.generate_state_cloropleth(latest_data, boundaries.for_fips(county_index, latest_data['fips']), min_cases, max_cases, renderer)
+
+        if self.gen_regional_map:
+            latest_data = latest_data[latest_data['county_nam'].isin(counties)]
+            min_cases = latest_data['Active_Cases_10k_Pop'].min()
+            max_cases = latest_data['Active_Cases_10k_Pop'].max()
+
+            county_index = self.map_boundaries(renderer, 'regional_map', latest_data[['mydate', 'fips', 'county_nam', 'Active_Cases_10k_Pop']], counties)
+            if county_index is not None:
+                figures.generate_state_cloropleth(latest_data, boundaries.for_fips(county_index, latest_data['fips']), min_cases, max_cases, renderer, 'regional_map')
+
+        if self.gen_cases_graph:
+            cases_slice = full_data[full_data['mydate'] > '2020-09-13'][['mydate', 'county_nam', 'active_cases', 'pp']]
+            if not renderer.reuse('active_cases_graph', render.content_hash(cases_slice, counties, '2020-09-13', points)):
+                region = self.aggregates.sums(self.all_counties, ['active_cases'])
+                region['pp'] = self.aggregates.means(self.all_counties, ['pp'])['pp']
+                figures.generate_active_cases_graph(full_data, counties, renderer, region.reset_index(), points)
+
+        return renderer.flush()
+
+    def map_boundaries(self, renderer, name, *parts):
+        '''
+        County boundaries for the map `name` drawn from parts, or None when the map
+        is served from the figure cache. Maps are keyed by the boundaries too; the
+        GeoJSON last downloaded is checked first, so it is only fetched (with a
+        conditional request) for a map that is rebuilt.
+        '''
+        url = self.urls['county_geojson']
+        states = self.cfg.get('boundary_states', boundaries.STATE_FIPS)
+        precision = self.cfg.get('boundary_precision')
+        map_key = lambda sha1: render.content_hash(*parts, sha1, list(states), precision)
+        cached = fetch_cache.cached_sha1(url, self.cache_dir)
+        if renderer.reuse(name, map_key(cached)):
+            return None
+        county_index, sha1 = boundaries.load_county_boundaries(url, states, precision, self.cache_dir, self.timeout(url))
+        # the boundaries changed upstream, the map is keyed by the new ones
+        if sha1 != cached and renderer.reuse(name, map_key(sha1)):
+            return None
+        return county_index
+
+    def commit(self, summary_msg):
+        '''
+        Publish the summary unless another run already published this data date, and
+        record the date in the state file once every target got it. The state is
+        re-read under the lock, so concurrent runs publish each data date exactly
+        once. When some deliveries failed the date is not recorded; the targets
+        that got it are, and the next run only delivers to the others.
+        '''
+        with run_state.locked(self.state_path):
+            self.state = run_state.load_state(self.state_path)
+            if self.new_data and self.state.get('ar_covid_latest_index') == self.data_date:
+                logging.info('Summary for ' + self.data_date + ' was already published')
+                return False
+
+            delivered = set()
+            if self.new_data and self.state.get('delivered_date') == self.data_date:
+                delivered = set(self.state.get('delivered', []))
+            with metrics.stage('publish'):
+                deliveries = self.publish(summary_msg, delivered)
+            metrics.count('publish', rows=len(deliveries))
+
+            failed = [delivery for delivery in deliveries if not delivery['ok']]
+            if self.new_data:
+                if failed:
+                    delivered.update(delivery['channel'] + ':' + target for delivery in deliveries if delivery['ok']
+                                     for target in delivery['target'].split(','))
+                    self.state.update({'delivered_date': self.data_date, 'delivered': sorted(delivered)})
+                else:
+                    self.state.update({'ar_covid_latest_index': self.data_date,
+                                       'published_at': self.now.isoformat()})
+                    self.state.pop('delivered_date', None)
+                    self.state.pop('delivered', None)
+                run_state.save_state(self.state, self.state_path)
+        if failed:
+            logging.warning(str(len(failed)) + ' deliveries failed, they are retried on the next run')
+            return False
+        return True
+
+    def run(self):
+        '''
+        All stages of one report. Their timings are written as configured under
+        metrics in config.yaml, also when a stage fails.
+        '''
+        metrics.reset()
+        try:
+            return self.run_stages()
+        finally:
+            # sources prefetched but not needed this run are requested again next run
+            fetch_cache.clear_prefetched()
+            metrics_cfg = self.cfg.get('metrics', {})
+            metrics.write(metrics_cfg.get('json'), metrics_cfg.get('prometheus'))
+
+    def run_stages(self, refresh=True):
+        self.published = False
+        with metrics.stage('load'):
+            if not self.load(refresh):
+                return None
+        with metrics.stage('grouping'):
+            self.compute()
+        metrics.count('grouping', rows=len(self.data))
+        with metrics.stage('narrative'):
+            summary_msg = self.narrate()
+        metrics.count('narrative', rows=len(self.counties))
+        if not self.commit(summary_msg):
+            return None
+        self.published = self.new_data
+        logging.info('post_stats complete' + (' for ' + self.name if self.name else ''))
+
+        if self.new_data:
+            with metrics.stage('render'):
+                self.render()
+        return summary_msg
+
+def profile_configs(cfg):
+    '''
+    One config per entry under profiles in config.yaml: the top level settings
+    with the keys of the profile laid over them, sections such as publish and
+    render key by key. Unless a profile sets them, each profile keeps its own
+    state file and figure directory, named after it.
+    '''
+    configs = []
+    for profile in cfg.get('profiles') or []:
+        name = profile['name']
+        profile_cfg = {key: value for key, value in cfg.items() if key != 'profiles'}
+        state_root, state_ext = os.path.splitext(cfg.get('state_file', run_state.STATE_PATH))
+        profile_cfg['state_file'] = state_root + '.' + name + state_ext
+        profile_cfg['render'] = dict(cfg.get('render', {}))
+        profile_cfg['render']['output_dir'] = os.path.join(profile_cfg['render'].get('output_dir', render.OUTPUT_DIR), name)
+        for key, value in profile.items():
+            if isinstance(value, dict) and isinstance(profile_cfg.get(key), dict):
+                profile_cfg[key] = dict(profile_cfg[key], **value)
+            else:
+                profile_cfg[key] = value
+        configs.append(profile_cfg)
+    return configs
+
+class ReportSet:
+    '''
+    The reports of every profile in config.yaml. The master data, Rt, regional
+    aggregates and correlations are fetched and computed once per run; each
+    profile only narrates, renders and publishes its own counties to its own
+    targets.
+    '''
 
-def post_to_facebook(group, msg):
-    credentials = read_creds('./credentials.json')
-
-    graph = GraphAPI(access_token=credentials['facebook_access_token'])
-
-    link = 'https://arkansascovid.com/'
-    groups = [group]
-
-    logging.info("Posting to group # " + str(groups))
-    for group in groups:
-        graph.put_object(group, 'feed', message=msg, link=link)
-        #logging.debug(graph.get_connections(group, 'feed'))
-
-def send_email(subject, body):
-    credentials = read_creds('./credentials.json')
-    username = credentials['gmail_username']
-    password = credentials['gmail_app_password']
-
-    to = [username]
-    print(to)
-
-    message = MIMEText(body, 'plain', 'utf-8')
-    message['Subject'] = subject
-    message['From'] = username
-    message['To'] = ','.join(to)
-
-    try:
-        server = smtplib.SMTP_SSL('smtp.gmail.com', 465)
-        server.ehlo()
-        server.login(username, password)
-        server.sendmail(message['From'], message['To'], message.as_string())
-        server.close()
-        logging.debug('Email sent!')
-    except Exception as e:
-        logging.exception('Something went wrong', e)
-
-data = read_data(master_url, 0)
-
-data['mydate'] = pd.to_datetime(data['mydate'])
-# Prepending the state FIPS number to the county FIPS number for geojson indexing purposes
-data['fips'] = '05' + data['fips'].astype(str).str.zfill(3)
-
-# calculate 14 day average positivity rate for each county of interest
-frames = []
-for county in counties:
-    ppdf = calculate_positivity_rate(data, county, 14)
-    frames.append(ppdf)
-full_data = pd.concat(frames)
-
-#initial experiments with Pearson Correlation
-if gen_matrix:
-    df_pivot = full_data[full_data['mydate'] > '9/12/2020'].pivot('mydate','county_nam','14d_pp').reset_index()
-    corr_df = df_pivot.corr(method='pearson')
-    #reset symbol as index (rather than 0-X)
-    corr_df.head().reset_index()
-    logging.debug(corr_df.head(10))
-    #take the bottom triangle since it repeats itself
-    mask = np.zeros_like(corr_df)
-    mask[np.triu_indices_from(mask)] = True
-    #generate plot
-    seaborn.heatmap(corr_df, cmap='RdYlGn', vmax=1.0, vmin=-1.0 , mask = mask, linewidths=2.5)
-    plt.yticks(rotation=0)
-    plt.xticks(rotation=90)
-    plt.show()
-
-# beginnings of grouping to calculate regional statistics and to do analysis on county border interactions
-frames = []
-for county in counties:
-    if county != p_county:
-        g_df = group_counties(full_data, p_county, county)
-        frames.append(g_df)
-grouped_data = pd.concat(frames)
-
-county_text = u', '.join(counties)
-summary_msg = u"Statistics Summary for " + county_text + " Counties (" + now.strftime('%A, %b %d, %Y') + ')\n\n'
-
-for county in counties:
-    county_msg = generate_county_narrative(full_data, county)
-
-    if county_msg:
-        new_data = True
-
-    if new_data:
-        msg = county_msg
-    else:
-        msg = "No new data found at " + str(now) + " for " + county + " County\n\n"
-
-    summary_msg = summary_msg + msg
-
-summary_msg = summary_msg + generate_rt_narrative()
-summary_msg = summary_msg + generate_positivity_explanation()
-summary_msg = summary_msg + generate_cfr_explanation()
-summary_msg = summary_msg + u"Sources:\n - https://arkansascovid.com/\n - https://rt.live/us/AR"
-
-logging.debug(summary_msg)
-
-if post and (new_data or post_negative_results):
-    post_to_facebook(group, summary_msg)
-
-if email and (new_data or post_negative_results):
-    subject = 'COVID-19 Support for Union County and Surrounding Areas, Daily Update for ' + now.strftime("%A, %b %d, %Y %k:%M")
-    send_email(subject, summary_msg)
-
-logging.info('post_stats complete')
-
-if new_data:
-    if gen_bullet:
-        generate_bullet(full_data)
-    if gen_line:
-        generate_line(full_data)
-
-    if gen_state_map or gen_regional_map:
-        latest_data = data.set_index('mydate')
-        max_date = latest_data.index.max()
-        latest_data = data.set_index('mydate')
-        latest_data = data[data['mydate'] == max_date]
-
-    if gen_state_map:
-        latest_data = latest_data[latest_data['county_nam'] != 'Arkansas_all_counties']
-        min_cases = latest_data['Active_Cases_10k_Pop'].min()
-        max_cases = latest_data['Active_Cases_10k_Pop'].max()
-
-        generate_state_cloropleth(latest_data, county_boundaries, min_cases, max_cases)
-
-    if gen_regional_map:
-        latest_data = latest_data[latest_data['county_nam'].isin(counties)]
-        min_cases = latest_data['Active_Cases_10k_Pop'].min()
-        max_cases = latest_data['Active_Cases_10k_Pop'].max()
-
-        generate_state_cloropleth(latest_data, county_boundaries, min_cases, max_cases)
-
-    if gen_cases_graph:
-        generate_active_cases_graph(full_data, counties)
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.shared = SharedData(cfg)
+        self.reports = [Report(profile_cfg, self.shared) for profile_cfg in profile_configs(cfg)]
+        # the regions of all profiles are aggregated together, in one store
+        for report in self.reports:
+            self.shared.register_regions(report.regions)
+
+    def run(self):
+        '''
+        Run every profile on one refresh of the shared data. A failing profile does
+        not keep the others from publishing; the first error is raised once all
+        have run. Returns {profile name: summary or None}.
+        '''
+        metrics.reset()
+        summaries = {}
+        error = None
+        try:
+            urls = []
+            for report in self.reports:
+                urls.extend(url for url in report.prefetch_urls() if url not in urls)
+            with metrics.stage('load'):
+                self.shared.refresh(urls)
+
+            for report in self.reports:
+                try:
+                    summaries[report.name] = report.run_stages(refresh=False)
+                except Exception as e:
+                    logging.exception('Profile ' + report.name + ' failed')
+                    summaries[report.name] = None
+                    error = error or e
+            if error is not None:
+                raise error
+            return summaries
+        finally:
+            # sources prefetched but not needed this run are requested again next run
+            fetch_cache.clear_prefetched()
+            metrics_cfg = self.cfg.get('metrics', {})
+            metrics.write(metrics_cfg.get('json'), metrics_cfg.get('prometheus'))
+
+def make_report(cfg):
+    '''
+    A ReportSet when config.yaml lists profiles, otherwise the single Report.
+    '''
+    if cfg.get('profiles'):
+        return ReportSet(cfg)
+    return Report(cfg)
+
+def main(config_path='./config.yaml'):
+    cfg = load_config(config_path)
+    configure_logging(cfg)
+    with metrics.profiled(cfg.get('metrics', {}).get('profile')):
+        make_report(cfg).run()
+
+if __name__ == '__main__':
+    main()
@@ -1,72 +1,107 @@
-import json
 import logging
-import yaml
+import sys
 import pandas as pd
 import io
-import requests
-
-import matplotlib.pyplot as plt
-import seaborn as sns
-from matplotlib.ticker import FuncFormatter
-
-
-with open("/users/robrogers/usr/local/facebook/config.yaml", 'r') as ymlfile:
-    cfg = yaml.load(ymlfile, Loader=yaml.FullLoader)
-
-if str(cfg['logging']) == 'console':
-    logging.basicConfig(format='%(levelname)s:%(asctime)s %(message)s', level=logging.DEBUG)
-
-logFormatter = logging.Formatter("%(asctime)s [%(threadName)-12.12s] [%(levelname)-5.5s]  %(message)s")
-rootLogger = logging.getLogger()
-
-fileHandler = logging.FileHandler("{0}/{1}.log".format('/users/robrogers/usr/local/facebook', 'post_stats'))
-fileHandler.setFormatter(logFormatter)
-rootLogger.addHandler(fileHandler)
-
-consoleHandler = logging.StreamHandler()
-consoleHandler.setFormatter(logFormatter)
-rootLogger.addHandler(consoleHandler)
-
-def read_data(url, index):
-    logging.debug('Getting data from ' + url)
-    s = requests.get(url).content
-    c = pd.read_csv(io.StringIO(s.decode('utf-8')), index_col=index)
-
-    return c
+from concurrent.futures import ThreadPoolExecutor
+import fetch_cache
+import fips_store
+import metrics
+import post_stats
 
 nyt_live_url = 'https://github.com/nytimes/covid-19-data/raw/master/live/us-counties.csv'
 nyt_h_url = 'https://github.com/nytimes/covid-19-data/raw/master/us-counties.csv'
 
-states = ['Arkansas', 'Louisiana']
-counties = ['Union', 'Columbia', 'Ouachita', 'Calhoun', 'Bradley']
-states_counties = {'Arkansas': ['Union', 'Columbia', 'Ouachita', 'Calhoun', 'Bradley'], 'Louisiana': ['Union']}
-
-live_df = read_data(nyt_live_url, None)
-live_df = live_df[live_df.state.isin(states)]
-live_df = live_df[live_df.county.isin(counties)]
-live_df = live_df[['date', 'county', 'state', 'fips', 'cases', 'deaths']]
-live_df['date'] = pd.to_datetime(live_df['date'])
-
-historical_df = read_data(nyt_h_url, None)
-historical_df = historical_df[historical_df.state.isin(states)]
-historical_df = historical_df[historical_df.county.isin(counties)]
-historical_df['date'] = pd.to_datetime(historical_df['date'])
-
-merged_df = pd.concat([live_df, historical_df])
-
-frames = []
-for state, county_list in states_counties.items():
-    for county in county_list:
-        logging.info(state + " " + county)
-        county_df = merged_df[(merged_df.state == state) & (merged_df.county == county)]
-        county_df.sort_values(by=['date'], inplace=True, ascending=False)
-        county_df['New_Cases_Today'] = county_df['cases'] - county_df['cases'].shift(-1).fillna(0)
-        county_df['New_Deaths_Today'] = county_df['deaths'] - county_df['deaths'].shift(-1).fillna(0)
-        print (county_df.head(10))
-        frames.append(county_df)
-
-merged_df = pd.concat(frames)
-merged_df.sort_values(by=['date'], inplace=True, ascending=False)
-print (merged_df.head(20))
-
-merged_df.to_csv('nyt_filtered.csv', index=False)
+# a state mapped to None is processed for all of its counties
+STATES_COUNTIES = {'Arkansas': ['Union', 'Columbia', 'Ouachita', 'Calhoun', 'Bradley'], 'Louisiana': None}
+
+def line_filter(states_counties):
+    '''
+    Byte patterns matching the "county,state," part of a raw us-counties.csv line.
+    A state without a county list matches all of its counties.
+    '''
+    patterns = []
+    for state, county_list in states_counties.items():
+        if county_list:
+            patterns.extend((',' + county + ',' + state + ',').encode('utf-8') for county in county_list)
+        else:
+            patterns.append((',' + state + ',').encode('utf-8'))
+    return patterns
+
+def read_filtered(url, states_counties, chunk_size=1 << 16, timeout=fetch_cache.TIMEOUT):
+    '''
+    Stream a NYT county csv and keep only the lines of the requested states/counties
+    while downloading, so memory is bounded by the matching rows rather than the
+    size of the nationwide file.
+    '''
+    logging.debug('Streaming data from ' + url)
+    patterns = line_filter(states_counties)
+    streamed = 0
+    with metrics.stage('fetch'), fetch_cache.get_session().get(url, stream=True, timeout=timeout) as r:
+        r.raise_for_status()
+        lines = r.iter_lines(chunk_size=chunk_size)
+        kept = [next(lines)]
+        for line in lines:
+            streamed += len(line) + 1
+            if any(pattern in line for pattern in patterns):
+                kept.append(line)
+    metrics.count('fetch', bytes=streamed)
+    with metrics.stage('parse'):
+        c = pd.read_csv(io.BytesIO(b'\n'.join(kept)))
+    metrics.count('parse', rows=len(c))
+
+    # the byte prefilter is a superset, apply the exact filter on the parsed rows
+    mask = pd.Series(False, index=c.index)
+    for state, county_list in states_counties.items():
+        state_mask = c.state == state
+        if county_list:
+            state_mask &= c.county.isin(county_list)
+        mask |= state_mask
+    return c[mask]
+
+def add_daily_deltas(df):
+    '''
+    New_Cases_Today/New_Deaths_Today for every (state, county) in one grouped pass.
+    Returns the rows newest first.
+    '''
+    df = df.sort_values(by=['state', 'county', 'date'], ascending=[True, True, False])
+    grouped = df.groupby(['state', 'county'], sort=False)
+    df['New_Cases_Today'] = df['cases'] - grouped['cases'].shift(-1).fillna(0)
+    df['New_Deaths_Today'] = df['deaths'] - grouped['deaths'].shift(-1).fillna(0)
+    return df.sort_values(by=['date'], ascending=False, kind='stable')
+
+def load_nyt_data(states_counties=STATES_COUNTIES):
+    # both downloads share the pooled session and run concurrently
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        live_future = executor.submit(read_filtered, nyt_live_url, states_counties)
+        historical_future = executor.submit(read_filtered, nyt_h_url, states_counties)
+    live_df = live_future.result()
+    historical_df = historical_future.result()
+
+    live_df = live_df[['date', 'county', 'state', 'fips', 'cases', 'deaths']]
+    live_df['date'] = pd.to_datetime(live_df['date'])
+
+    historical_df['date'] = pd.to_datetime(historical_df['date'])
+
+    merged_df = pd.concat([live_df, historical_df])
+    # the live file repeats the newest day(s) of the historical file; prefer the historical rows
+    merged_df = merged_df.drop_duplicates(subset=['state', 'county', 'date'], keep='last')
+
+    return add_daily_deltas(merged_df)
+
+def main(config_path='./config.yaml', log_dir='./'):
+    cfg = post_stats.load_config(config_path)
+    post_stats.configure_logging(cfg, log_dir, 'process_nyt_data')
+
+    merged_df = load_nyt_data()
+    logging.info(str(merged_df.groupby(['state', 'county']).ngroups) + " counties processed")
+    logging.debug(merged_df.head(20))
+
+    merged_df.to_csv('nyt_filtered.csv', index=False)
+    fips_path = cfg.get('fips_store', fips_store.FIPS_PATH)
+    if fips_path:
+        fips_store.update_source('nyt', merged_df, fips_path)
+    # stage timings are only logged, the metrics files belong to post_stats
+    metrics.write()
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,272 @@
+import json
+import logging
+import os
+import smtplib
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+import requests
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+import fetch_cache
+
+GRAPH_URL = 'https://graph.facebook.com'
+SMTP_HOST = 'smtp.gmail.com'
+SMTP_PORT = 465
+DELIVERY_LOG = './cache/deliveries.jsonl'
+
+# Graph API error codes for application, user and page level rate limits
+RATE_LIMIT_CODES = (4, 17, 32, 613)
+
+
+class DeliveryError(Exception):
+    def __init__(self, message, retry=False, wait=None):
+        super().__init__(message)
+        self.retry = retry
+        self.wait = wait
+
+
+def with_retries(send, retries, backoff):
+    '''
+    Call send() until it succeeds, retrying DeliveryErrors marked as retryable with
+    exponential backoff (or the wait the server asked for). Returns the number of
+    attempts; the last error is raised once the retries are used up.
+    '''
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            send()
+            return attempt
+        except DeliveryError as e:
+            if not e.retry or attempt > retries:
+                e.attempts = attempt
+                raise
+            wait = e.wait if e.wait is not None else backoff * 2 ** (attempt - 1)
+            logging.warning(str(e) + ', retrying in ' + str(wait) + 's')
+            time.sleep(wait)
+
+
+def redact(text, secrets):
+    '''
+    text with every secret replaced, for error messages that may quote a request.
+    '''
+    for secret in secrets:
+        if secret:
+            text = text.replace(secret, '[redacted]')
+    return text
+
+
+def never_sent(error):
+    '''
+    True when a requests error shows the request never reached the server: the
+    connection could not be opened. After that a POST may have been processed.
+    '''
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(error, requests.ConnectionError) and isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+
+class GraphClient:
+    '''
+    Posts to group feeds over one pooled, authenticated session. base_url can point
+    at a local stand-in of the Graph API. The access token goes in the Authorization
+    header, so it is not part of the URLs that requests quotes in its errors.
+    '''
+
+    def __init__(self, access_token, base_url=GRAPH_URL, pool_size=10, timeout=fetch_cache.TIMEOUT):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        # POSTs are not retried by the adapter, with_retries decides what is safe to repeat
+        self.session = fetch_cache.make_session(pool_size=pool_size, retries=0)
+        self.access_token = access_token
+        self.session.headers['Authorization'] = 'Bearer ' + access_token
+
+    def post(self, group, msg, link=None):
+        data = {'message': msg}
+        if link:
+            data['link'] = link
+        try:
+            r = self.session.post(self.base_url + '/' + str(group) + '/feed', data=data, timeout=self.timeout)
+        except requests.RequestException as e:
+            # a post is only repeated when it cannot have been created, read timeouts
+            # and dropped connections may leave a post behind
+            raise DeliveryError('Posting to group ' + str(group) + ' failed: ' + redact(str(e), [self.access_token]),
+                                retry=never_sent(e))
+        if r.ok:
+            try:
+                return r.json().get('id')
+            except ValueError:
+                logging.warning('Graph API accepted the post to group ' + str(group) + ' without a JSON reply')
+                return None
+        try:
+            code = r.json().get('error', {}).get('code')
+        except ValueError:
+            code = None
+        retry_after = r.headers.get('Retry-After')
+        # rate limited posts were rejected and are safe to repeat; a 5xx may come after the post was created
+        raise DeliveryError('Graph API returned ' + str(r.status_code) + ' (code ' + str(code) + ') for group ' + str(group),
+                            retry=r.status_code == 429 or code in RATE_LIMIT_CODES,
+                            wait=float(retry_after) if retry_after else None)
+
+
+class SMTPClient:
+    '''
+    One logged-in SMTP connection, opened on first use and reopened when the server
+    dropped it. Without a username no login is attempted (local stand-ins).
+    '''
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, username=None, password=None, ssl=True, timeout=fetch_cache.TIMEOUT):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.ssl = ssl
+        self.timeout = timeout
+        self.server = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        if self.ssl:
+            server = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        server.ehlo()
+        if self.username:
+            server.login(self.username, self.password)
+        return server
+
+    def send(self, message, recipients):
+        # one connection carries one transaction at a time
+        with self.lock:
+            try:
+                if self.server is None:
+                    self.server = self.connect()
+                refused = self.server.sendmail(message['From'], recipients, message.as_string())
+            except smtplib.SMTPResponseException as e:
+                # 4xx replies are temporary (greylisting, rate limits), 5xx are final
+                raise DeliveryError('SMTP server replied ' + str(e.smtp_code) + ': ' + str(e.smtp_error), retry=400 <= e.smtp_code < 500)
+            except smtplib.SMTPRecipientsRefused as e:
+                raise DeliveryError('All recipients refused: ' + ', '.join(e.recipients))
+            except OSError as e:
+                # dropped connections and network errors, reconnect on the next attempt
+                self.server = None
+                raise DeliveryError('SMTP connection to ' + self.host + ' failed: ' + str(e), retry=True)
+        if refused:
+            raise DeliveryError('Recipients refused: ' + ', '.join(refused))
+
+    def close(self):
+        with self.lock:
+            if self.server is not None:
+                try:
+                    self.server.quit()
+                except smtplib.SMTPException:
+                    pass
+                self.server = None
+
+
+class Publisher:
+    '''
+    Delivers a summary to many Facebook groups and email recipients in one batch.
+    Clients are created on first use and kept, so a long running process reuses
+    them across runs. At most `workers` deliveries are in flight; every outcome is
+    appended to the delivery log as a JSON line.
+    '''
+
+    def __init__(self, credentials, cfg=None):
+        cfg = cfg or {}
+        self.credentials = credentials
+        self.graph_url = cfg.get('graph_url', GRAPH_URL)
+        self.smtp_host = cfg.get('smtp_host', SMTP_HOST)
+        self.smtp_port = cfg.get('smtp_port', SMTP_PORT)
+        self.smtp_ssl = cfg.get('smtp_ssl', True)
+        self.batch_size = cfg.get('batch_size', 50)
+        self.workers = cfg.get('workers', 4)
+        self.retries = cfg.get('retries', 3)
+        self.backoff = cfg.get('backoff', 2)
+        self.timeout = cfg.get('timeout', fetch_cache.TIMEOUT)
+        self.delivery_log = cfg.get('delivery_log', DELIVERY_LOG)
+        self.log_lock = threading.Lock()
+        self._graph = None
+        self._smtp = None
+        # kept out of the log and the delivery log
+        self.secrets = [credentials.get('facebook_access_token'), credentials.get('gmail_app_password')]
+
+    @property
+    def graph(self):
+        if self._graph is None:
+            self._graph = GraphClient(self.credentials['facebook_access_token'], self.graph_url,
+                                      pool_size=self.workers, timeout=self.timeout)
+        return self._graph
+
+    @property
+    def smtp(self):
+        if self._smtp is None:
+            self._smtp = SMTPClient(self.smtp_host, self.smtp_port,
+                                    self.credentials.get('gmail_username'),
+                                    self.credentials.get('gmail_app_password'),
+                                    self.smtp_ssl, self.timeout)
+        return self._smtp
+
+    def record(self, channel, target, attempts, error=None):
+        entry = {'time': datetime.now().isoformat(), 'channel': channel, 'target': target,
+                 'ok': error is None, 'attempts': attempts}
+        if error is not None:
+            entry['error'] = redact(str(error), self.secrets)
+            logging.error('Delivery to ' + channel + ' ' + target + ' failed: ' + entry['error'])
+        else:
+            logging.info('Delivered to ' + channel + ' ' + target)
+        os.makedirs(os.path.dirname(self.delivery_log) or '.', exist_ok=True)
+        with self.log_lock:
+            with open(self.delivery_log, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+        return entry
+
+    def _deliver(self, channel, target, send):
+        try:
+            attempts = with_retries(send, self.retries, self.backoff)
+        except DeliveryError as e:
+            return self.record(channel, target, e.attempts, e)
+        except Exception as e:
+            # any other failure is recorded too, so one target can not abort the batch
+            logging.error('Unexpected error delivering to ' + channel + ' ' + target + '\n'
+                          + redact(traceback.format_exc(), self.secrets))
+            return self.record(channel, target, 1, e)
+        return self.record(channel, target, attempts)
+
+    def post_to_groups(self, groups, msg, link=None):
+        graph = self.graph
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(
+                lambda group: self._deliver('facebook', str(group), lambda: graph.post(group, msg, link)),
+                groups))
+
+    def send_email(self, subject, body, recipients, html=None):
+        '''
+        Recipients are sent in Bcc batches of batch_size over the shared connection.
+        With html the message carries it as an alternative to the plain text body.
+        '''
+        sender = self.credentials.get('gmail_username') or recipients[0]
+        results = []
+        for i in range(0, len(recipients), self.batch_size):
+            batch = recipients[i:i + self.batch_size]
+            message = MIMEText(body, 'plain', 'utf-8')
+            if html is not None:
+                message = MIMEMultipart('alternative')
+                message.attach(MIMEText(body, 'plain', 'utf-8'))
+                message.attach(MIMEText(html, 'html', 'utf-8'))
+            message['Subject'] = subject
+            message['From'] = sender
+            message['To'] = sender
+            results.append(self._deliver('email', ','.join(batch), lambda: self.smtp.send(message, batch)))
+        return results
+
+    def close(self):
+        if self._smtp is not None:
+            self._smtp.close()
@@ -0,0 +1,135 @@
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+
+import storage
+
+REGIONS_PATH = './cache/regions.feather'
+ALL_COUNTIES = 'All Counties'
+# summed row hashes of a region day, to find the days whose county rows changed
+FINGERPRINT = 'rows_fingerprint'
+
+
+def default_regions(counties, primary_county, all_counties=ALL_COUNTIES):
+    '''
+    The regions of the report: the primary county paired with each other county
+    (the combos of group_counties) and all report counties (group_all_counties),
+    named all_counties.
+    '''
+    regions = {primary_county + ' + ' + county: [primary_county, county]
+               for county in counties if county != primary_county}
+    regions[all_counties] = list(counties)
+    return regions
+
+
+def fingerprints(rows):
+    '''
+    A 52-bit hash of every row, small enough that the sum over the rows of a region
+    and date fits in an int64 and changes whenever one of those rows does.
+    '''
+    hashes = pd.util.hash_pandas_object(rows, index=False).to_numpy() >> np.uint64(12)
+    return pd.Series(hashes.astype(np.int64), index=rows.index)
+
+
+def aggregate(data, regions, stored=None):
+    '''
+    Per-date sum and non-null count of every numeric column for each region, in one
+    grouped pass over a county -> region membership join, with the summed
+    fingerprints of the rows of each region and date. Region days of stored whose
+    fingerprint is unchanged are left out: only days that are new, or that got a
+    late or corrected county row, are summed.
+    '''
+    membership = pd.DataFrame([(name, county) for name, members in regions.items() for county in members],
+                              columns=['region', 'county_nam'])
+    numeric = list(data.select_dtypes('number').columns)
+    rows = data.loc[data['county_nam'].isin(membership['county_nam']), ['county_nam', 'mydate'] + numeric]
+    rows = rows.assign(county_nam=rows['county_nam'].astype(str))
+    rows = rows.assign(**{FINGERPRINT: fingerprints(rows)}).merge(membership, on='county_nam')
+    keys = ['region', 'mydate']
+    if stored is not None and len(stored):
+        current = rows.groupby(keys)[FINGERPRINT].sum()
+        previous = stored.set_index(keys)[FINGERPRINT].reindex(current.index)
+        changed = current.index[previous.to_numpy() != current.to_numpy()]
+        rows = rows[pd.MultiIndex.from_frame(rows[keys]).isin(changed)]
+    grouped = rows.groupby(keys)
+    return pd.concat([grouped[numeric].sum().add_suffix('_sum'), grouped[numeric].count().add_suffix('_n'),
+                      grouped[FINGERPRINT].sum()], axis=1).reset_index()
+
+
+class RegionalAggregates:
+    '''
+    Materialized per-date sums and counts of every region, indexed by (region, mydate)
+    so a regional sum or mean for a date is a single row lookup.
+    '''
+
+    def __init__(self, frame):
+        self.frame = frame.set_index(['region', 'mydate']).sort_index()
+        self.columns = [column[:-len('_sum')] for column in self.frame.columns if column.endswith('_sum')]
+
+    def regions(self):
+        return list(self.frame.index.unique(level='region'))
+
+    def sums(self, region, columns=None):
+        columns = columns or self.columns
+        rows = self.frame.loc[region]
+        return rows[[column + '_sum' for column in columns]].set_axis(columns, axis=1)
+
+    def means(self, region, columns=None):
+        columns = columns or self.columns
+        rows = self.frame.loc[region]
+        sums = rows[[column + '_sum' for column in columns]].to_numpy()
+        counts = rows[[column + '_n' for column in columns]].to_numpy()
+        return pd.DataFrame(sums / counts, index=rows.index, columns=columns)
+
+    def mean_at(self, region, date, column):
+        row = self.frame.loc[(region, pd.Timestamp(date))]
+        return row[column + '_sum'] / row[column + '_n']
+
+    def sum_at(self, region, date, column):
+        return self.frame.loc[(region, pd.Timestamp(date)), column + '_sum']
+
+
+def update_regions(data, regions, path=REGIONS_PATH):
+    '''
+    Bring the aggregates of the given regions up to date with data and return them.
+    Stored regions with an unchanged definition only aggregate the dates whose
+    county rows were added or changed (late rows, recomputed positivity), found by
+    their fingerprints; new or redefined regions are aggregated in full. The
+    definitions are kept in a JSON file next to the store.
+    '''
+    definitions = {name: sorted(members) for name, members in regions.items()}
+    defs_path = path + '.json'
+
+    stored = None
+    stored_definitions = {}
+    if os.path.exists(path) and os.path.exists(defs_path):
+        stored = feather.read_table(path, memory_map=True).to_pandas()
+        with open(defs_path) as f:
+            stored_definitions = json.load(f)
+        numeric = data.select_dtypes('number').columns
+        expected = {'region', 'mydate', FINGERPRINT} | {c + '_sum' for c in numeric} | {c + '_n' for c in numeric}
+        if set(stored.columns) != expected:
+            logging.info('Master or aggregate columns changed, rebuilding regional aggregates')
+            stored = None
+        else:
+            stored = stored[stored['region'].isin(
+                [name for name in definitions if stored_definitions.get(name) == definitions[name]])]
+
+    new = aggregate(data, definitions, stored)
+    if stored is not None and new.empty and stored_definitions == definitions:
+        return RegionalAggregates(stored)
+
+    logging.debug('Aggregating ' + str(len(new)) + ' new or changed region days')
+    frame = new
+    if stored is not None:
+        replaced = pd.MultiIndex.from_frame(stored[['region', 'mydate']]).isin(pd.MultiIndex.from_frame(new[['region', 'mydate']]))
+        frame = pd.concat([stored[~replaced], new], ignore_index=True)
+    frame = frame.sort_values(by=['region', 'mydate'], ignore_index=True)
+
+    storage.write_feather(frame, path)
+    storage.write_bytes(defs_path, json.dumps(definitions, indent=2, sort_keys=True))
+    return RegionalAggregates(frame)
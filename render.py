@@ -0,0 +1,208 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+OUTPUT_DIR = './figures'
+FORMATS = ('png', 'html')
+CACHE_SIZE = 200 * 1024 * 1024
+
+
+def content_hash(*parts):
+    '''
+    Stable hash of the data slices and settings a figure is built from. Frames are
+    hashed by column names and cell values, everything else by its JSON form.
+    '''
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, (pd.DataFrame, pd.Series)):
+            columns = part.columns if isinstance(part, pd.DataFrame) else [part.name]
+            h.update(json.dumps([str(column) for column in columns]).encode('utf-8'))
+            h.update(pd.util.hash_pandas_object(part, index=False).values.tobytes())
+        else:
+            h.update(json.dumps(part, sort_keys=True, default=str).encode('utf-8'))
+    return h.hexdigest()
+
+
+class FigureCache:
+    '''
+    Exported figure files keyed by content hash, evicted least recently used first
+    once the directory grows beyond max_bytes. An entry is its manifest (the list of
+    formats) and one file per format; the manifest's modification time is the
+    entry's last use.
+    '''
+
+    def __init__(self, directory, max_bytes=CACHE_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key, fmt):
+        return os.path.join(self.directory, key + '.' + fmt)
+
+    def get(self, key, path_base):
+        manifest = self._path(key, 'json')
+        if not os.path.exists(manifest):
+            return None
+        with open(manifest) as f:
+            formats = json.load(f)
+        cached = [self._path(key, fmt) for fmt in formats]
+        if not all(os.path.exists(path) for path in cached):
+            return None
+        # bump the modification time of the manifest, it is the recency used for eviction
+        os.utime(manifest)
+        paths = []
+        for fmt, path in zip(formats, cached):
+            shutil.copyfile(path, path_base + '.' + fmt)
+            paths.append(path_base + '.' + fmt)
+        return paths
+
+    def put(self, key, paths):
+        formats = [path.rsplit('.', 1)[1] for path in paths]
+        for fmt, path in zip(formats, paths):
+            shutil.copyfile(path, self._path(key, fmt))
+        with open(self._path(key, 'json'), 'w') as f:
+            json.dump(formats, f)
+        self.evict()
+
+    def evict(self):
+        '''
+        Remove whole entries, least recently used first, until the directory fits
+        max_bytes. Files without a manifest go first.
+        '''
+        entries = {}
+        for name in os.listdir(self.directory):
+            entries.setdefault(name.split('.', 1)[0], []).append(os.path.join(self.directory, name))
+        manifest_time = lambda key: os.path.getmtime(self._path(key, 'json')) if os.path.exists(self._path(key, 'json')) else 0
+        total = sum(os.path.getsize(path) for paths in entries.values() for path in paths)
+        for key in sorted(entries, key=manifest_time):
+            if total <= self.max_bytes:
+                break
+            for path in entries[key]:
+                total -= os.path.getsize(path)
+                os.remove(path)
+
+
+def export_plotly(fig_jsons, path_bases, formats):
+    '''
+    Write a batch of serialized plotly figures in every format. Static images of the
+    whole batch go through one kaleido session (plotly.io.write_images, or the
+    persistent kaleido process of older plotly versions) instead of one per figure.
+    '''
+    import plotly.io as pio
+
+    figs = [pio.from_json(fig_json) for fig_json in fig_jsons]
+    paths = [[] for fig in figs]
+    for fmt in formats:
+        fmt_paths = [path_base + '.' + fmt for path_base in path_bases]
+        if fmt == 'html':
+            for fig, path in zip(figs, fmt_paths):
+                fig.write_html(path, include_plotlyjs='cdn')
+        elif hasattr(pio, 'write_images'):
+            pio.write_images(figs, fmt_paths, format=fmt)
+        else:
+            for fig, path in zip(figs, fmt_paths):
+                fig.write_image(path, format=fmt)
+        for fig_paths, path in zip(paths, fmt_paths):
+            fig_paths.append(path)
+    return paths
+
+
+def export_matplotlib(fig, path_base, formats):
+    paths = []
+    for fmt in formats:
+        if fmt == 'html':
+            continue
+        path = path_base + '.' + fmt
+        fig.savefig(path, format=fmt, bbox_inches='tight')
+        paths.append(path)
+    return paths
+
+
+class Renderer:
+    '''
+    Destination for every figure of a run. In 'show' mode figures open interactively
+    as before; in 'export' mode they are written to output_dir (png/svg/html/...)
+    without a display, plotly figures batched and exported by `workers` processes
+    on flush(). With a cache, figures whose inputs hash to a known key are copied
+    from the cache instead of being built and rendered (see reuse()).
+    '''
+
+    def __init__(self, mode='show', output_dir=OUTPUT_DIR, formats=FORMATS, workers=1, cache=None):
+        self.mode = mode
+        self.output_dir = output_dir
+        self.formats = list(formats)
+        self.workers = workers
+        self.cache = cache
+        self.keys = {}
+        self.pending = []
+        self.paths = {}
+        if mode == 'export':
+            import matplotlib.pyplot as plt
+            plt.switch_backend('Agg')
+            os.makedirs(output_dir, exist_ok=True)
+
+    def reuse(self, name, key):
+        '''
+        True when the figure `name` for content hash `key` was served from the cache;
+        otherwise the key is remembered so the figure is cached once exported.
+        '''
+        if self.mode == 'show' or self.cache is None:
+            return False
+        key = content_hash(key, self.formats)
+        paths = self.cache.get(key, os.path.join(self.output_dir, name))
+        if paths is None:
+            self.keys[name] = key
+            return False
+        logging.debug('Reusing cached ' + name + ' figure')
+        self.paths[name] = paths
+        return True
+
+    def _exported(self, name, paths):
+        self.paths[name] = paths
+        if self.cache is not None and name in self.keys:
+            self.cache.put(self.keys.pop(name), paths)
+
+    def add_plotly(self, name, fig):
+        if self.mode == 'show':
+            fig.show()
+        else:
+            self.pending.append((name, fig.to_json()))
+
+    def add_matplotlib(self, name, fig):
+        '''
+        Matplotlib figures are saved right away, so style contexts such as plt.xkcd()
+        that are active while the figure is drawn still apply.
+        '''
+        import matplotlib.pyplot as plt
+
+        if self.mode == 'show':
+            plt.show()
+        else:
+            self._exported(name, export_matplotlib(fig, os.path.join(self.output_dir, name), self.formats))
+            plt.close(fig)
+
+    def flush(self):
+        pending, self.pending = self.pending, []
+        if not pending:
+            return self.paths
+        # one batch per worker process, each keeping its own renderer warm
+        n = max(1, min(self.workers, len(pending)))
+        batches = [pending[i::n] for i in range(n)]
+        args = ([[fig_json for name, fig_json in batch] for batch in batches],
+                [[os.path.join(self.output_dir, name) for name, fig_json in batch] for batch in batches],
+                [self.formats] * n)
+        if n > 1:
+            with ProcessPoolExecutor(max_workers=n) as executor:
+                results = list(executor.map(export_plotly, *args))
+        else:
+            results = [export_plotly(*[arg[0] for arg in args])]
+        for batch, batch_paths in zip(batches, results):
+            for (name, fig_json), paths in zip(batch, batch_paths):
+                logging.debug('Rendered ' + name + ' to ' + ', '.join(paths))
+                self._exported(name, paths)
+        return self.paths
@@ -0,0 +1,105 @@
+import logging
+import os
+import sys
+
+import pandas as pd
+
+import fetch_cache
+import master_store
+import metrics
+import narrative
+import positivity
+import post_stats
+import render
+import rt
+
+EXTENSIONS = {'text': 'txt', 'markdown': 'md', 'html': 'html'}
+
+
+def replay(data, counties, start=None, end=None, rt_index=None, rt_regions=rt.REGIONS, fmt='text'):
+    '''
+    The daily summary of every date from start to end, as {date: summary}, as the
+    report would have written it that day. All county narratives of the range come
+    from one daily_metrics table; Rt is the latest estimate on or before each date.
+    '''
+    data = data[data['county_nam'].isin(counties)]
+    table = narrative.daily_metrics(data, start, end)
+    by_date = {}
+    for date, (county, today_date, msg) in zip(table['mydate'], narrative.render_rows(table, fmt)):
+        by_date.setdefault(date, {})[county] = msg
+
+    county_text = u', '.join(counties)
+    summaries = {}
+    for date, msgs in by_date.items():
+        county_msgs = [msgs.get(county) or narrative.paragraph("No data found for " + county + " County\n\n", fmt)
+                       for county in counties]
+        rt_msg = post_stats.generate_rt_narrative(rt_index, rt_regions, date) if rt_index is not None else ''
+        summaries[date] = post_stats.assemble_summary(county_text, date.strftime('%A, %b %d, %Y'), county_msgs, rt_msg, fmt)
+    return summaries
+
+
+def write_summaries(summaries, output_dir, fmt='text'):
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for date, summary in summaries.items():
+        path = os.path.join(output_dir, date.strftime('%Y-%m-%d') + '.' + EXTENSIONS[fmt])
+        with open(path, 'w') as f:
+            f.write(summary)
+        paths.append(path)
+    return paths
+
+
+def replay_figures(data, counties, dates, who_t, output_dir, render_cfg=None):
+    '''
+    Export the bullet, line and active cases figures of each date, drawn from the
+    data known on that day, to output_dir/<date>/.
+    '''
+    import figures
+
+    render_cfg = render_cfg or {}
+    slices = master_store.county_slices(data)
+    full_data = pd.concat([data.iloc[slices[county]][::-1] for county in counties if county in slices])
+    full_data = full_data.set_index(pd.DatetimeIndex(full_data['mydate'].values))
+
+    for date in dates:
+        known = full_data[full_data['mydate'] <= date]
+        renderer = render.Renderer('export', os.path.join(output_dir, date.strftime('%Y-%m-%d')),
+                                   render_cfg.get('formats', render.FORMATS), render_cfg.get('workers', 1))
+        figures.generate_bullet(known, counties, who_t, renderer)
+        figures.generate_line(known, who_t, renderer, render_cfg.get('points'))
+        figures.generate_active_cases_graph(known, counties, renderer, points=render_cfg.get('points'))
+        renderer.flush()
+
+
+def main(start, end, config_path='./config.yaml'):
+    cfg = post_stats.load_config(config_path)
+    post_stats.configure_logging(cfg)
+    replay_cfg = cfg.get('replay', {})
+    fmt = replay_cfg.get('format', 'text')
+    output_dir = replay_cfg.get('output_dir', './replay')
+    cache_dir = cfg.get('cache_dir', fetch_cache.CACHE_DIR)
+    timeouts = cfg.get('timeouts', {})
+
+    data = master_store.load_master(cfg['urls']['ar_covid'],
+                                    cfg.get('master_store', master_store.STORE_PATH),
+                                    cache_dir,
+                                    cfg.get('positivity_periods', positivity.PERIODS))
+    counties = cfg['counties']
+    if replay_cfg.get('counties') == 'all':
+        counties = [str(county) for county in data['county_nam'].cat.categories if county != 'Arkansas_all_counties']
+    rt_index = rt.update_rt(None, cfg['urls']['rt'], cfg.get('rt_store', rt.RT_PATH), cache_dir,
+                            timeouts.get('rt', fetch_cache.TIMEOUT))
+
+    with metrics.stage('narrative'):
+        summaries = replay(data, counties, start, end, rt_index, cfg.get('rt_regions', rt.REGIONS), fmt)
+        write_summaries(summaries, output_dir, fmt)
+    logging.info(str(len(summaries)) + ' daily summaries written to ' + output_dir)
+
+    if replay_cfg.get('figures'):
+        with metrics.stage('render'):
+            replay_figures(data, counties, list(summaries), float(cfg['who_threshold']), output_dir, cfg.get('render', {}))
+    metrics.write()
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,86 @@
+import io
+import logging
+import os
+
+import pandas as pd
+import pyarrow.feather as feather
+
+import fetch_cache
+import metrics
+import storage
+
+RT_PATH = './cache/rt.feather'
+COLUMNS = ['date', 'region', 'mean', 'median', 'lower_80', 'upper_80']
+REGIONS = {'AR': 'Arkansas'}
+# rt.live re-estimates recent days, so these trailing days are replaced on every update
+REVISION_DAYS = 14
+
+
+class RtIndex(storage.SortedIndex):
+    '''
+    Rt estimates sorted by (region, date). The latest value of a region is a
+    direct lookup and a value or series for a date range a binary search over
+    that region's dates.
+    '''
+    key = 'region'
+
+    def regions(self):
+        return self.keys()
+
+    def max_date(self):
+        return self.frame['date'].max() if len(self.frame) else None
+
+    def latest(self, region):
+        start, stop = self.bounds[region]
+        return self.frame.iloc[stop - 1]
+
+    def at(self, region, date):
+        '''
+        The estimate for date, or for the last date before it.
+        '''
+        i = self.search(region, date, side='right') - 1
+        if i < self.bounds[region][0]:
+            raise KeyError('No Rt for ' + region + ' on or before ' + str(date))
+        return self.frame.iloc[i]
+
+
+def parse(content, since=None):
+    '''
+    Parse rt.csv, keeping only rows dated after since. Dates are ISO strings, so they
+    are filtered before any of them is converted.
+    '''
+    with metrics.stage('parse'):
+        frame = pd.read_csv(io.BytesIO(content), usecols=lambda column: column in COLUMNS, dtype={'date': str})
+        if since is not None:
+            frame = frame[frame['date'] > since.strftime('%Y-%m-%d')]
+        frame['date'] = pd.to_datetime(frame['date'])
+        frame['region'] = frame['region'].astype(str)
+    metrics.count('parse', rows=len(frame))
+    return frame
+
+
+def update_rt(index=None, url=None, path=RT_PATH, cache_dir=fetch_cache.CACHE_DIR, timeout=fetch_cache.TIMEOUT):
+    '''
+    Bring an RtIndex (or the one stored at path) up to date with rt.csv. Nothing is
+    parsed while the file is unchanged; otherwise only the rows after the last
+    stored date, less REVISION_DAYS, are parsed and replace the stored tail.
+    '''
+    content, changed = fetch_cache.fetch(url, cache_dir, timeout=timeout)
+    if index is None and os.path.exists(path):
+        index = RtIndex(feather.read_table(path, memory_map=True).to_pandas())
+    if index is not None and not changed:
+        return index
+
+    since = None
+    stored = None
+    if index is not None and index.max_date() is not None:
+        since = index.max_date() - pd.Timedelta(days=REVISION_DAYS)
+        stored = index.frame[index.frame['date'] <= since]
+    new = parse(content, since)
+    logging.debug('Updating Rt index with ' + str(len(new)) + ' rows')
+    frame = new if stored is None else pd.concat([stored, new], ignore_index=True)
+    index = RtIndex(frame)
+
+    storage.write_feather(index.frame, path)
+    fetch_cache.mark_read(url, cache_dir)
+    return index
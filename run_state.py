@@ -0,0 +1,34 @@
+import contextlib
+import fcntl
+import json
+import os
+
+import storage
+
+STATE_PATH = './cache/state.json'
+
+
+def load_state(path=STATE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(state, path=STATE_PATH):
+    storage.write_bytes(path, json.dumps(state, indent=2, sort_keys=True))
+
+
+@contextlib.contextmanager
+def locked(path=STATE_PATH):
+    '''
+    Exclusive lock next to the state file, held from reading the state until the
+    new state is saved, so two runs can not publish the same data date.
+    '''
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,96 @@
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+
+# the process umask, which can only be read by setting it
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def write_atomic(path, write):
+    '''
+    Let write(tmp_path) write the file next to path, then move it over path, so a
+    crash or a concurrent reader never sees a partly written file. Every call gets
+    its own temporary file, as the daemon and cron runs may write the same path.
+    '''
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + '.')
+    os.close(fd)
+    try:
+        # mkstemp creates the file private, the replaced file gets the usual mode
+        os.chmod(tmp_path, 0o666 & ~_UMASK)
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def write_bytes(path, content):
+    '''
+    Atomically write bytes or text (as UTF-8), flushed to disk before the move.
+    '''
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+
+    def write(tmp_path):
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+    write_atomic(path, write)
+
+
+def write_feather(frame, path):
+    '''
+    Atomically write an uncompressed Feather file, so readers can memory-map it.
+    '''
+    write_atomic(path, lambda tmp_path: feather.write_feather(frame, tmp_path, compression='uncompressed'))
+
+
+def row_ranges(keys):
+    '''
+    (starts, stops) of every run of equal values in keys, e.g. the row range of
+    every county in a frame sorted by county.
+    '''
+    keys = np.asarray(keys)
+    if not len(keys):
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return starts, np.r_[starts[1:], len(keys)]
+
+
+class SortedIndex:
+    '''
+    A frame sorted by (key, date), `key` being the column named by the subclass.
+    Every key is a contiguous row range, so a date is a binary search within it
+    and a date range a slice.
+    '''
+    key = None
+
+    def __init__(self, frame):
+        self.frame = frame.sort_values(by=[self.key, 'date'], ignore_index=True)
+        keys = self.frame[self.key].to_numpy()
+        self.bounds = {keys[start]: (start, stop) for start, stop in zip(*row_ranges(keys))}
+        self.dates = self.frame['date'].to_numpy()
+
+    def keys(self):
+        return list(self.bounds)
+
+    def search(self, key, date, side='left'):
+        '''
+        Row of the frame where date would be inserted among the dates of key.
+        '''
+        start, stop = self.bounds[key]
+        return start + np.searchsorted(self.dates[start:stop], np.datetime64(pd.Timestamp(date)), side=side)
+
+    def series(self, key, start_date=None, end_date=None):
+        start, stop = self.bounds[key]
+        first = self.search(key, start_date) if start_date is not None else start
+        last = self.search(key, end_date, side='right') if end_date is not None else stop
+        return self.frame.iloc[first:last]
@@ -0,0 +1,31 @@
+import json
+
+import boundaries
+import fetch_cache
+
+
+def county(fips, x):
+    return {'type': 'Feature', 'id': fips,
+            'geometry': {'type': 'Polygon', 'coordinates': [[[x, 0], [x + 1, 0], [x + 1, 1], [x, 0]]]}}
+
+
+def test_boundaries_follow_upstream_changes(monkeypatch, tmp_path):
+    upstream = {}
+
+    def fetch(url, cache_dir, timeout):
+        return upstream['body'], upstream.pop('changed', False)
+    monkeypatch.setattr(fetch_cache, 'fetch', fetch)
+    monkeypatch.setattr(boundaries, '_loaded', {})
+
+    upstream['body'] = json.dumps({'type': 'FeatureCollection', 'features': [county('05001', 0)]}).encode('utf-8')
+    upstream['changed'] = True
+    index, digest = boundaries.load_county_boundaries('url', cache_dir=str(tmp_path))
+    assert list(index) == ['05001']
+    assert boundaries.load_county_boundaries('url', cache_dir=str(tmp_path)) == (index, digest)
+
+    # a new upstream body replaces the index kept in memory
+    upstream['body'] = json.dumps({'type': 'FeatureCollection', 'features': [county('05001', 0), county('05003', 1)]}).encode('utf-8')
+    upstream['changed'] = True
+    index, new_digest = boundaries.load_county_boundaries('url', cache_dir=str(tmp_path))
+    assert sorted(index) == ['05001', '05003']
+    assert new_digest != digest
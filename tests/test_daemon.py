@@ -0,0 +1,161 @@
+import hashlib
+import http.server
+import json
+import os
+import sys
+import threading
+
+import pandas as pd
+import pytest
+
+import daemon
+import fetch_cache
+import post_stats
+import render
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+from synthetic import synthetic_master
+
+
+class Upstream(http.server.BaseHTTPRequestHandler):
+    '''
+    Serves the bodies of `files` by path, with an ETag honoured on If-None-Match.
+    '''
+    files = {}
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        body = self.files[self.path]
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Graph(http.server.BaseHTTPRequestHandler):
+    posts = []
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.posts.append(self.path)
+        body = b'{"id": "1_2"}'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def servers():
+    Upstream.files = {}
+    Upstream.requests = []
+    Graph.posts = []
+    started = [http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler) for handler in (Upstream, Graph)]
+    for server in started:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield ['http://127.0.0.1:' + str(server.server_port) for server in started]
+    for server in started:
+        server.shutdown()
+        server.server_close()
+    fetch_cache.clear_prefetched()
+
+
+def report_config(upstream_url, graph_url, tmp_path):
+    cfg = {
+        'test_mode': True, 'test_group_uid': 1, 'group_uid': 2,
+        'post_to_facebook': True, 'send_email': False, 'post_negative_results': False,
+        'publish': {'graph_url': graph_url, 'retries': 0, 'delivery_log': str(tmp_path / 'deliveries.jsonl')},
+        'urls': {'ar_covid': upstream_url + '/master_file.csv', 'rt': upstream_url + '/rt.csv',
+                 'county_geojson': upstream_url + '/counties.json'},
+        'who_threshold': 0.05, 'counties': ['County 0', 'County 1'], 'primary_county': 'County 0',
+        'positivity_periods': [14], 'fips_store': None, 'cache_dir': str(tmp_path / 'cache'),
+        'state_file': str(tmp_path / 'state.json'), 'master_store': str(tmp_path / 'master.feather'),
+        'regions_store': str(tmp_path / 'regions.feather'), 'rt_store': str(tmp_path / 'rt.feather'),
+    }
+    for figure in ('bullet', 'line', 'matrix', 'regional_map', 'state_map', 'xkcd_graph', 'cases_graph'):
+        cfg['generate_' + figure] = False
+    return cfg
+
+
+def rt_csv(dates):
+    return pd.DataFrame({'date': dates.strftime('%Y-%m-%d'), 'region': 'AR', 'mean': 1.0, 'median': 1.0,
+                         'lower_80': 0.9, 'upper_80': 1.1}).to_csv(index=False).encode('utf-8')
+
+
+class Failing:
+    def __init__(self, failures):
+        self.failures = list(failures)
+        self.runs = 0
+        self.published = False
+        self.name = None
+
+    def run(self):
+        self.runs += 1
+        if self.failures:
+            raise self.failures.pop(0)
+
+
+def test_poll_survives_failing_runs():
+    runner = Failing([IndexError('bad profile'), KeyError('county')])
+    daemon.poll(runner, 0, runs=3)
+    assert runner.runs == 3
+
+
+def test_each_upstream_change_is_published_once(servers, tmp_path, monkeypatch):
+    upstream_url, graph_url = servers
+    monkeypatch.chdir(tmp_path)
+    with open('credentials.json', 'w') as f:
+        json.dump({'facebook_access_token': 'token', 'gmail_username': 'me@example.org'}, f)
+
+    raw = synthetic_master(3, 41)
+    dates = pd.to_datetime(raw['mydate'])
+    Upstream.files['/master_file.csv'] = raw[dates < dates.max()].to_csv().encode('utf-8')
+    Upstream.files['/rt.csv'] = rt_csv(pd.date_range(end=dates.max(), periods=30))
+
+    report = post_stats.make_report(report_config(upstream_url, graph_url, tmp_path))
+    daemon.poll(report, 0, runs=3)
+    assert len(Graph.posts) == 1
+    with open(tmp_path / 'state.json') as f:
+        assert json.load(f)['ar_covid_latest_index'] == (dates.max() - pd.Timedelta(days=1)).strftime('%A, %b %d, %Y')
+
+    # a new day upstream is published on the next poll, and only once
+    Upstream.files['/master_file.csv'] = raw.to_csv().encode('utf-8')
+    daemon.poll(report, 0, runs=2)
+    assert len(Graph.posts) == 2
+    with open(tmp_path / 'state.json') as f:
+        assert json.load(f)['ar_covid_latest_index'] == dates.max().strftime('%A, %b %d, %Y')
+
+
+def test_geojson_is_only_fetched_for_rebuilt_maps(servers, tmp_path):
+    upstream_url, graph_url = servers
+    Upstream.files['/counties.json'] = json.dumps({'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'id': '05001', 'geometry': {'type': 'Point', 'coordinates': [-91.3, 34.3]}}]}).encode('utf-8')
+    cfg = report_config(upstream_url, graph_url, tmp_path)
+    cfg.update({'generate_state_map': True, 'boundary_states': ['05']})
+    report = post_stats.make_report(cfg)
+    assert upstream_url + '/counties.json' not in report.prefetch_urls()
+
+    renderer = render.Renderer('export', str(tmp_path / 'figures'), ['html'],
+                               cache=render.FigureCache(str(tmp_path / 'figure_cache')))
+    latest = pd.DataFrame({'fips': ['05001'], 'Active_Cases_10k_Pop': [1.5]})
+    assert list(report.map_boundaries(renderer, 'state_map', latest)) == ['05001']
+    assert Upstream.requests == ['/counties.json']
+    # the map is exported, as figures would, and then served from the cache without a request
+    with open(tmp_path / 'figures' / 'state_map.html', 'w') as f:
+        f.write('<div></div>')
+    renderer._exported('state_map', [str(tmp_path / 'figures' / 'state_map.html')])
+    assert report.map_boundaries(renderer, 'state_map', latest) is None
+    assert Upstream.requests == ['/counties.json']
@@ -0,0 +1,118 @@
+import hashlib
+import http.server
+import threading
+
+import pytest
+
+import fetch_cache
+import rt
+import storage
+
+
+class Upstream(http.server.BaseHTTPRequestHandler):
+    '''
+    Serves `body` with an ETag and honours If-None-Match unless `validators` is off.
+    '''
+    body = b'a,1\n'
+    validators = True
+    requests = []
+
+    def do_GET(self):
+        etag = '"' + hashlib.sha1(self.body).hexdigest() + '"'
+        self.requests.append(dict(self.headers))
+        if self.validators and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        if self.validators:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def upstream():
+    Upstream.body = b'a,1\n'
+    Upstream.validators = True
+    Upstream.requests = []
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Upstream)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield 'http://127.0.0.1:' + str(server.server_port) + '/rt.csv'
+    server.shutdown()
+    server.server_close()
+    fetch_cache.clear_prefetched()
+
+
+@pytest.fixture
+def session():
+    return fetch_cache.make_session(retries=0)
+
+
+def test_200_then_304(upstream, session, tmp_path):
+    assert fetch_cache.fetch(upstream, str(tmp_path), session) == (b'a,1\n', True)
+    fetch_cache.mark_read(upstream, str(tmp_path))
+    assert fetch_cache.fetch(upstream, str(tmp_path), session) == (b'a,1\n', False)
+    assert 'If-None-Match' not in Upstream.requests[0]
+    assert Upstream.requests[1]['If-None-Match']
+
+    Upstream.body = b'a,2\n'
+    assert fetch_cache.fetch(upstream, str(tmp_path), session) == (b'a,2\n', True)
+
+
+def test_identical_body_without_validators(upstream, session, tmp_path):
+    Upstream.validators = False
+    assert fetch_cache.fetch(upstream, str(tmp_path), session) == (b'a,1\n', True)
+    fetch_cache.mark_read(upstream, str(tmp_path))
+    assert fetch_cache.fetch(upstream, str(tmp_path), session) == (b'a,1\n', False)
+    assert len(Upstream.requests) == 2
+
+
+def test_prefetch_is_handed_out_once(upstream, session, tmp_path):
+    fetch_cache.prefetch([upstream], str(tmp_path), session=session)
+    assert len(Upstream.requests) == 1
+    assert fetch_cache.fetch(upstream, str(tmp_path), session) == (b'a,1\n', True)
+    fetch_cache.mark_read(upstream, str(tmp_path))
+    assert len(Upstream.requests) == 1
+    assert fetch_cache.fetch(upstream, str(tmp_path), session) == (b'a,1\n', False)
+    assert len(Upstream.requests) == 2
+
+
+def test_unconsumed_prefetch_is_requested_again(upstream, session, tmp_path):
+    fetch_cache.prefetch([upstream], str(tmp_path), session=session)
+    fetch_cache.clear_prefetched()
+    Upstream.body = b'a,2\n'
+    fetch_cache.prefetch([upstream], str(tmp_path), session=session)
+    fetch_cache.clear_prefetched()
+    fetch_cache.prefetch([upstream], str(tmp_path), session=session)
+    fetch_cache.clear_prefetched()
+    assert len(Upstream.requests) == 3
+
+    # the change was downloaded by a prefetch nobody used, it is still reported
+    assert fetch_cache.fetch(upstream, str(tmp_path), session) == (b'a,2\n', True)
+    fetch_cache.mark_read(upstream, str(tmp_path))
+    assert fetch_cache.fetch(upstream, str(tmp_path), session) == (b'a,2\n', False)
+
+
+def test_change_is_reported_until_stored(upstream, session, tmp_path, monkeypatch):
+    Upstream.body = b'date,region,mean\n2022-03-01,AR,1.1\n'
+    path = str(tmp_path / 'rt.feather')
+    monkeypatch.setattr(fetch_cache, 'get_session', lambda: session)
+
+    def fail(frame, path):
+        raise OSError('disk full')
+    with monkeypatch.context() as m:
+        m.setattr(storage, 'write_feather', fail)
+        with pytest.raises(OSError):
+            rt.update_rt(None, upstream, path, str(tmp_path))
+
+    # the next run gets a 304, but the body was never stored and is still reported as changed
+    assert fetch_cache.fetch(upstream, str(tmp_path), session) == (Upstream.body, True)
+    index = rt.update_rt(None, upstream, path, str(tmp_path))
+    assert index.regions() == ['AR']
+    assert 'If-None-Match' in Upstream.requests[-1]
+    assert fetch_cache.fetch(upstream, str(tmp_path), session) == (Upstream.body, False)
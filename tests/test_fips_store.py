@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pandas as pd
+
+import fips_store
+import master_store
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+from synthetic import synthetic_master
+
+
+def test_late_and_corrected_rows_are_written(tmp_path, monkeypatch):
+    path = str(tmp_path / 'fips.feather')
+    data = master_store.normalize(synthetic_master(3, 30))
+    old_day = data['mydate'].max() - pd.Timedelta(days=10)
+    late = (data['county_nam'] == 'County 1') & (data['mydate'] == old_day)
+    fips_store.update_source('ar', data[~late], path)
+
+    # County 1 reports an old day late, and County 0 corrects one
+    corrected = data.copy()
+    fix = (corrected['county_nam'] == 'County 0') & (corrected['mydate'] == old_day - pd.Timedelta(days=3))
+    corrected.loc[fix, 'positive'] += 5
+    written = []
+    upsert = fips_store.upsert
+    monkeypatch.setattr(fips_store, 'upsert', lambda source, rows, path, index: written.append(len(rows)) or upsert(source, rows, path, index))
+    index = fips_store.update_source('ar', corrected, path)
+
+    assert written == [2]
+    assert index.at(data.loc[late, 'fips'].iloc[0], old_day)['ar_cases'] == data.loc[late, 'positive'].iloc[0]
+    assert index.at(corrected.loc[fix, 'fips'].iloc[0], old_day - pd.Timedelta(days=3))['ar_cases'] == corrected.loc[fix, 'positive'].iloc[0]
+    # nothing changed, nothing is written
+    fips_store.update_source('ar', corrected, path)
+    assert written == [2]
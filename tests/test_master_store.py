@@ -0,0 +1,35 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+import fetch_cache
+import master_store
+import positivity
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+from synthetic import synthetic_master
+
+
+def test_late_county_rows_are_appended(monkeypatch, tmp_path):
+    raw = synthetic_master(5, 40)
+    dates = pd.to_datetime(raw['mydate'])
+    # County 2 reports a day five days late, after the store has newer days of every county
+    late = (raw['county_nam'] == 'County 2') & (dates == dates.max() - pd.Timedelta(days=5))
+    upstream = {}
+    monkeypatch.setattr(fetch_cache, 'fetch', lambda url, cache_dir: (upstream['body'], True))
+    path = str(tmp_path / 'master.feather')
+
+    upstream['body'] = raw[(dates < dates.max() - pd.Timedelta(days=2)) & ~late].to_csv().encode('utf-8')
+    assert master_store.update_store('url', path, periods=(14,))
+    upstream['body'] = raw.to_csv().encode('utf-8')
+    assert master_store.update_store('url', path, periods=(14,))
+    assert not master_store.update_store('url', path, periods=(14,))
+
+    stored = master_store.read_store(path)
+    expected = positivity.calculate_positivity_rates(master_store.normalize(raw.copy()), (14,))
+    expected = expected.sort_values(by=['county_nam', 'mydate'], ignore_index=True)
+    assert len(stored) == len(raw)
+    assert (stored['mydate'].to_numpy() == expected['mydate'].to_numpy()).all()
+    assert np.allclose(stored['14d_pp'].to_numpy(), expected['14d_pp'].to_numpy(), equal_nan=True)
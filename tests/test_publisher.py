@@ -0,0 +1,187 @@
+import http.server
+import json
+import socket
+import socketserver
+import threading
+import time
+
+import pytest
+
+import publisher
+
+
+class Graph(http.server.BaseHTTPRequestHandler):
+    '''
+    Graph API stand-in replying with the scripted (status, body, delay) of `replies`
+    in turn, then 200 with a post id.
+    '''
+    replies = []
+    posts = []
+    tokens = []
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.posts.append(self.path)
+        self.tokens.append(self.headers.get('Authorization'))
+        status, body, delay = self.replies.pop(0) if self.replies else (200, b'{"id": "1_2"}', 0)
+        time.sleep(delay)
+        self.send_response(status)
+        if status == 429:
+            self.send_header('Retry-After', '0')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class SMTP(socketserver.StreamRequestHandler):
+    '''
+    Just enough SMTP for smtplib. The end of each DATA gets the next scripted reply
+    of `replies`, then 250.
+    '''
+    replies = []
+    messages = []
+
+    def reply(self, line):
+        self.wfile.write(line + b'\r\n')
+
+    def handle(self):
+        self.reply(b'220 localhost')
+        recipients = []
+        for line in self.rfile:
+            command = line[:4].upper()
+            if command == b'DATA':
+                self.reply(b'354 go ahead')
+                for data_line in self.rfile:
+                    if data_line == b'.\r\n':
+                        break
+                reply = self.replies.pop(0) if self.replies else b'250 queued'
+                if reply.startswith(b'250'):
+                    self.messages.append(list(recipients))
+                self.reply(reply)
+            elif command == b'QUIT':
+                self.reply(b'221 bye')
+                return
+            else:
+                if command == b'MAIL':
+                    recipients = []
+                elif command == b'RCPT':
+                    recipients.append(line.split(b'<')[1].split(b'>')[0].decode())
+                self.reply(b'250 ok')
+
+
+def serve(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def graph_url():
+    Graph.replies = []
+    Graph.posts = []
+    Graph.tokens = []
+    server = serve(http.server.ThreadingHTTPServer(('127.0.0.1', 0), Graph))
+    yield 'http://127.0.0.1:' + str(server.server_port)
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def smtp_port():
+    SMTP.replies = []
+    SMTP.messages = []
+    server = serve(socketserver.ThreadingTCPServer(('127.0.0.1', 0), SMTP))
+    yield server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+def make_publisher(tmp_path, token='token', **cfg):
+    settings = {'backoff': 0, 'retries': 2, 'timeout': 2, 'smtp_host': '127.0.0.1', 'smtp_ssl': False,
+                'delivery_log': str(tmp_path / 'deliveries.jsonl')}
+    settings.update(cfg)
+    return publisher.Publisher({'facebook_access_token': token}, settings)
+
+
+def delivery_log(tmp_path):
+    with open(tmp_path / 'deliveries.jsonl') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_post_retries_rate_limits(graph_url, tmp_path):
+    Graph.replies = [(429, b'{"error": {"code": 4}}', 0)]
+    deliveries = make_publisher(tmp_path, graph_url=graph_url).post_to_groups([1], 'summary')
+    assert [(d['ok'], d['attempts']) for d in deliveries] == [(True, 2)]
+    assert Graph.posts == ['/1/feed'] * 2
+    assert Graph.tokens == ['Bearer token'] * 2
+
+
+def test_post_gives_up_after_retries(graph_url, tmp_path):
+    Graph.replies = [(429, b'{}', 0)] * 3
+    deliveries = make_publisher(tmp_path, graph_url=graph_url).post_to_groups([1], 'summary')
+    assert [(d['ok'], d['attempts']) for d in deliveries] == [(False, 3)]
+    assert len(Graph.posts) == 3
+    assert [entry['ok'] for entry in delivery_log(tmp_path)] == [False]
+
+
+def test_post_is_not_repeated_after_a_server_error(graph_url, tmp_path):
+    Graph.replies = [(500, b'{"error": {"code": 2}}', 0)]
+    deliveries = make_publisher(tmp_path, graph_url=graph_url).post_to_groups([1], 'summary')
+    assert [(d['ok'], d['attempts']) for d in deliveries] == [(False, 1)]
+    assert len(Graph.posts) == 1
+
+
+def test_post_is_not_repeated_after_a_read_timeout(graph_url, tmp_path):
+    Graph.replies = [(200, b'{"id": "1_2"}', 1.5)]
+    deliveries = make_publisher(tmp_path, graph_url=graph_url, timeout=0.5).post_to_groups([1], 'summary')
+    assert [(d['ok'], d['attempts']) for d in deliveries] == [(False, 1)]
+    assert len(Graph.posts) == 1
+
+
+def test_post_without_json_reply_is_delivered(graph_url, tmp_path):
+    Graph.replies = [(200, b'ok', 0)]
+    deliveries = make_publisher(tmp_path, graph_url=graph_url).post_to_groups([1], 'summary')
+    assert [d['ok'] for d in deliveries] == [True]
+
+
+def test_post_retries_refused_connections(tmp_path):
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    deliveries = make_publisher(tmp_path, graph_url='http://127.0.0.1:' + str(port)).post_to_groups([1], 'summary')
+    assert [(d['ok'], d['attempts']) for d in deliveries] == [(False, 3)]
+
+
+def test_access_token_stays_out_of_logs(tmp_path, caplog):
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    pub = make_publisher(tmp_path, token='s3cret-token', graph_url='http://127.0.0.1:' + str(port), retries=0)
+    pub.post_to_groups([1], 'summary')
+    # a failure quoting the token, as an error message echoing a request would
+    pub.record('facebook', '1', 1, publisher.DeliveryError('rejected s3cret-token'))
+    assert 'Posting to group 1 failed' in caplog.text
+    assert 's3cret-token' not in caplog.text
+    assert 's3cret-token' not in (tmp_path / 'deliveries.jsonl').read_text()
+
+
+def test_email_batches_and_temporary_failures(smtp_port, tmp_path):
+    SMTP.replies = [b'451 try again later']
+    recipients = ['a@example.org', 'b@example.org', 'c@example.org']
+    pub = make_publisher(tmp_path, smtp_port=smtp_port, batch_size=2)
+    deliveries = pub.send_email('subject', 'body', recipients)
+    pub.close()
+    assert [(d['ok'], d['attempts']) for d in deliveries] == [(True, 2), (True, 1)]
+    assert SMTP.messages == [recipients[:2], recipients[2:]]
+
+
+def test_email_gives_up_on_permanent_failures(smtp_port, tmp_path):
+    SMTP.replies = [b'554 rejected']
+    pub = make_publisher(tmp_path, smtp_port=smtp_port)
+    deliveries = pub.send_email('subject', 'body', ['a@example.org'], html='<p>body</p>')
+    pub.close()
+    assert [(d['ok'], d['attempts']) for d in deliveries] == [(False, 1)]
+    assert SMTP.messages == []
+    assert delivery_log(tmp_path)[0]['error'].startswith('SMTP server replied 554')
@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pandas as pd
+
+import fetch_cache
+import master_store
+import regions
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+from synthetic import synthetic_master
+
+DEFINITIONS = {'County 0 + County 2': ['County 0', 'County 2'], 'All': ['County 0', 'County 1', 'County 2']}
+
+
+def test_incremental_update_matches_full_rebuild(monkeypatch, tmp_path):
+    raw = synthetic_master(4, 40)
+    dates = pd.to_datetime(raw['mydate'])
+    # County 2 reports a day five days late, after newer days of every county are aggregated
+    late = (raw['county_nam'] == 'County 2') & (dates == dates.max() - pd.Timedelta(days=5))
+    upstream = {}
+    monkeypatch.setattr(fetch_cache, 'fetch', lambda url, cache_dir: (upstream['body'], True))
+    store_path = str(tmp_path / 'master.feather')
+    path = str(tmp_path / 'regions.feather')
+
+    upstream['body'] = raw[(dates < dates.max() - pd.Timedelta(days=2)) & ~late].to_csv().encode('utf-8')
+    master_store.update_store('url', store_path, periods=(14,))
+    regions.update_regions(master_store.read_store(store_path), DEFINITIONS, path)
+
+    upstream['body'] = raw.to_csv().encode('utf-8')
+    master_store.update_store('url', store_path, periods=(14,))
+    data = master_store.read_store(store_path)
+    incremental = regions.update_regions(data, DEFINITIONS, path)
+    full = regions.update_regions(data, DEFINITIONS, str(tmp_path / 'full.feather'))
+
+    pd.testing.assert_frame_equal(incremental.frame, full.frame)
+    # the late day counts all three counties of the region
+    assert incremental.frame.loc[('All', dates.max() - pd.Timedelta(days=5)), 'positive_n'] == 3
+    # and the stored result is what the next run reads back
+    pd.testing.assert_frame_equal(regions.update_regions(data, DEFINITIONS, path).frame, full.frame)
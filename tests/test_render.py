@@ -0,0 +1,27 @@
+import os
+import time
+
+import render
+
+
+def cache_entry(cache, tmp_path, key, age):
+    path = str(tmp_path / (key + '.html'))
+    with open(path, 'w') as f:
+        f.write('x' * 1000)
+    cache.put(key, [path])
+    then = time.time() - age
+    for fmt in ('html', 'json'):
+        os.utime(os.path.join(cache.directory, key + '.' + fmt), (then, then))
+
+
+def test_recently_hit_entry_survives_eviction(tmp_path):
+    cache = render.FigureCache(str(tmp_path / 'cache'), max_bytes=2500)
+    cache_entry(cache, tmp_path, 'old', 100)
+    cache_entry(cache, tmp_path, 'newer', 50)
+    # the oldest entry is used again, so the other one is now the least recently used
+    assert cache.get('old', str(tmp_path / 'state_map')) == [str(tmp_path / 'state_map.html')]
+    cache_entry(cache, tmp_path, 'newest', 0)
+
+    assert cache.get('old', str(tmp_path / 'state_map')) is not None
+    assert cache.get('newer', str(tmp_path / 'state_map')) is None
+    assert sorted(os.listdir(cache.directory)) == ['newest.html', 'newest.json', 'old.html', 'old.json']
@@ -0,0 +1,43 @@
+import os
+import threading
+
+import pytest
+
+import storage
+
+
+def test_failed_write_keeps_the_old_file(tmp_path):
+    path = str(tmp_path / 'state.json')
+    storage.write_bytes(path, '{"a": 1}')
+
+    def fail(tmp_path):
+        with open(tmp_path, 'w') as f:
+            f.write('{"a"')
+        raise OSError('disk full')
+    with pytest.raises(OSError):
+        storage.write_atomic(path, fail)
+    with open(path) as f:
+        assert f.read() == '{"a": 1}'
+    assert os.listdir(tmp_path) == ['state.json']
+
+
+def test_concurrent_writers_do_not_share_a_temporary_file(tmp_path):
+    path = str(tmp_path / 'metrics.prom')
+    bodies = [str(i) * 100000 for i in range(8)]
+    errors = []
+
+    def write(body):
+        try:
+            for _ in range(20):
+                storage.write_bytes(path, body)
+        except OSError as e:
+            errors.append(e)
+    threads = [threading.Thread(target=write, args=(body,)) for body in bodies]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    with open(path) as f:
+        assert f.read() in bodies
+    assert os.listdir(tmp_path) == ['metrics.prom']